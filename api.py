@@ -0,0 +1,192 @@
+import hashlib
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+from sqlalchemy import func, select
+
+from loaders import current_time, venue_detail, artist_detail, artist_directory, venue_directory, show_detail, \
+    shows_page, shows_page_stamp
+from models import db, Venue, Artist, Show
+from replicas import replica_router
+from tours import create_tour
+
+
+# ----------------------------------------------------------------------------#
+# JSON API.
+# ----------------------------------------------------------------------------#
+
+# Every resource first computes a cheap fingerprint from row versions (see
+# models.version_column) and turns it into a strong ETag. A matching
+# If-None-Match is answered with 304 before any loader runs. The only write is
+# POST /tours.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+@api.before_request
+def read_from_replica():
+    # writes and the reads they validate with stay on the primary
+    if request.method in ('GET', 'HEAD'):
+        replica_router.use_replica()
+
+
+def _table_stamp(model):
+    table = model.__table__
+    # one scan per table, folded into a single column so tables can be combined
+    return select(func.concat_ws(
+        ':',
+        func.count(table.c.id),
+        func.coalesce(func.max(table.c.id), 0),
+        func.coalesce(func.sum(table.c.version), 0)
+    )).scalar_subquery()
+
+
+def _global_stamp(*models):
+    return tuple(db.session.execute(select(*[_table_stamp(model) for model in models])).one())
+
+
+def _detail_stamp(model, owner_id, show_owner, joined, now):
+    # the owning row, its shows and the rows joined into them, plus how many
+    # of those shows are still upcoming (which changes as time passes)
+    table = model.__table__
+    shows = Show.__table__
+    other = joined.__table__
+    other_id = shows.c.venue_id if joined is Venue else shows.c.artist_id
+    row = db.session.execute(
+        select(
+            table.c.version,
+            func.count(shows.c.id),
+            func.coalesce(func.max(shows.c.id), 0),
+            func.coalesce(func.sum(shows.c.version), 0),
+            func.coalesce(func.sum(other.c.version), 0),
+            func.count(shows.c.id).filter(shows.c.start_time > now)
+        ).select_from(
+            table.outerjoin(shows, show_owner == table.c.id).outerjoin(other, other.c.id == other_id)
+        ).where(table.c.id == owner_id, table.c.deleted_at.is_(None)).group_by(table.c.version)
+    ).first()
+    return None if row is None else tuple(row)
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _conditional(etag, build):
+    # 304 without building the payload when the client already has it
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    return response
+
+
+@api.errorhandler(404)
+def api_not_found(error):
+    return jsonify(error='not found'), 404
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def list_venues():
+    etag = _etag('venues', _global_stamp(Venue))
+    # built from the database like the ETag, not from this worker's area_index
+    return _conditional(etag, lambda: {"areas": venue_directory()})
+
+
+@api.route('/venues/<int:venue_id>')
+def get_venue(venue_id):
+    now = current_time()
+    stamp = _detail_stamp(Venue, venue_id, Show.__table__.c.venue_id, Artist, now)
+    if stamp is None:
+        abort(404)
+    # the body must be the row the ETag was computed from, not an older cached one
+    return _conditional(_etag('venue', venue_id, stamp), lambda: venue_detail(venue_id, now, stamp[0]))
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def list_artists():
+    etag = _etag('artists', _global_stamp(Artist))
+    return _conditional(etag, lambda: {"artists": artist_directory()})
+
+
+@api.route('/artists/<int:artist_id>')
+def get_artist(artist_id):
+    now = current_time()
+    stamp = _detail_stamp(Artist, artist_id, Show.__table__.c.artist_id, Venue, now)
+    if stamp is None:
+        abort(404)
+    return _conditional(_etag('artist', artist_id, stamp), lambda: artist_detail(artist_id, now, stamp[0]))
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def list_shows():
+    # same paging and filters as /shows
+    now = current_time()
+    upcoming_only = bool(request.args.get('upcoming', 0, type=int))
+    args = dict(
+        after=request.args.get('after'),
+        upcoming_only=upcoming_only,
+        start=request.args.get('start', type=datetime.fromisoformat),
+        end=request.args.get('end', type=datetime.fromisoformat),
+        limit=current_app.config.get('SHOWS_PAGE_SIZE', 30),
+        now=now
+    )
+    # the page's own rows and versions: an index range read instead of whole-table aggregates
+    stamp = shows_page_stamp(**args)
+    etag = _etag('shows', sorted((key, str(value)) for key, value in args.items() if key != 'now'), stamp)
+
+    def build():
+        data, next_cursor = shows_page(**args)
+        return {"shows": data, "next": next_cursor}
+
+    return _conditional(etag, build)
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+    row = db.session.execute(
+        select(Show.__table__.c.version, Venue.__table__.c.version, Artist.__table__.c.version)
+        .join_from(Show.__table__, Venue.__table__).join_from(Show.__table__, Artist.__table__)
+        .where(Show.__table__.c.id == show_id,
+               Venue.__table__.c.deleted_at.is_(None), Artist.__table__.c.deleted_at.is_(None))
+    ).first()
+    if row is None:
+        abort(404)
+    return _conditional(_etag('show', show_id, tuple(row)), lambda: show_detail(show_id))
+
+
+#  Tours
+#  ----------------------------------------------------------------
+
+@api.route('/tours', methods=['POST'])
+def post_tour():
+    # {"artist_id": 3, "shows": [{"venue_id": 1, "start_time": "2035-04-01 20:00:00", "duration": 90}, ...]}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('shows'), list) \
+            or not all(isinstance(show, dict) for show in payload['shows']):
+        return jsonify(error='expected {"artist_id": ..., "shows": [{"venue_id": ..., "start_time": ...}, ...]}'), 400
+    limit = current_app.config.get('TOUR_MAX_SHOWS', 200)
+    if len(payload['shows']) > limit:
+        return jsonify(error=f'a tour can list at most {limit} shows'), 400
+
+    rows = [{name: show.get(name) for name in ('venue_id', 'start_time', 'duration')} for show in payload['shows']]
+    try:
+        results = create_tour(str(payload.get('artist_id') or ''), rows)
+    except:
+        db.session.rollback()
+        return jsonify(error='the tour could not be listed, please try again'), 500
+    finally:
+        db.session.close()
+    created = sum(1 for result in results if result['status'] == 'created')
+    # 201 when every show was listed, 422 when none was, 207 for a partial tour
+    status = 201 if created == len(results) and results else 422 if not created else 207
+    return jsonify(artist_id=payload.get('artist_id'), created=created, results=results), status
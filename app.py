@@ -3,12 +3,30 @@
 # ----------------------------------------------------------------------------#
 
 import sys
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, \
+    stream_with_context
 from flask_moment import Moment
 import logging
-from models import Venue, Artist, Show, db_setup
+from models import Venue, Artist, Show, db_setup, DEFAULT_SHOW_DURATION
+from directory import area_index, suggest_index
+from loaders import current_time, venue_detail, artist_detail, artist_directory, venue_directory, shows_page
+from commands import fyyur_cli
+from search import search
+from api import api
+from page_cache import page_cache
+from query_stats import query_stats
+from profiler import request_profiler
+from metrics import metrics
+from replicas import replica_router
+from formatting import format_datetime, format_datetimes
+from exporter import FORMATS, export_chunks
+from facets import facet_cache, filter_args, parse_filters
+from bookings import find_conflicts, is_booking_violation, owner_errors
+from tours import create_tour, parse_tour_lines
+from deletion import soft_delete, purge_worker
+from entity_cache import entity_cache
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from flask_wtf import FlaskForm
 from logging import Formatter, FileHandler
 from forms import *
@@ -20,25 +38,31 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 db = db_setup(app)
+replica_router.init_app(app, db)
+app.cli.add_command(fyyur_cli)
+app.register_blueprint(api)
+page_cache.init_app(app)
+query_stats.init_app(app)
+request_profiler.init_app(app)
+metrics.init_app(app)
+purge_worker.init_app(app)
+entity_cache.init_app(app)
+with app.app_context():
+    for bind_key, engine in db.engines.items():
+        metrics.instrument_engine(engine, bind_key or 'primary')
+
+
+@metrics.collector
+def page_cache_metrics():
+    stats = page_cache.stats()
+    return [(f'fyyur_page_cache_{name}_total', {}, stats[name])
+            for name in ('hits', 'misses', 'bypasses', 'invalidations')]
 
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    # date = dateutil.parser.parse(value)
-    if isinstance(value, str):
-        date = dateutil.parser.parse(value)
-    else:
-        date = value
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 
@@ -55,32 +79,27 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues')
+@replica_router.read_only
 def venues():
     # TODO: replace with real venues data.
     #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
 
-    the_data = []
-    city_states = Venue.query.with_entities(Venue.city, Venue.state).distinct().all()
-    for city_state in city_states:
-        state = city_state[1]
-        city = city_state[0]
-        venue = Venue.query.filter_by(city=city, state=state).all()
-
-        details = {
-            "city": city,
-            "state": state,
-            "venues": venue
-        }
-        the_data.append(details)
-    return render_template('pages/venues.html', areas=the_data)
+    # grouped by (city, state) from one ordered query, then served from the in-process area index;
+    # filtered listings are queried (genre through the GIN index on venue.genres)
+    filters = parse_filters(request.args)
+    the_data = venue_directory(**filters) if filters else area_index.areas()
+    return render_template('pages/venues.html', areas=the_data, filters=filter_args(filters),
+                           facets=facet_cache.get(Venue, filters))
 
 
 @app.route('/venues/search', methods=['POST'])
+@replica_router.read_only
 def search_venues():
     # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
     # search for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    the_venues = Venue.query.filter(Venue.name.ilike('%' + request.form.get('search_term', '').strip() + '%')).all()
+    the_venues = search(Venue, request.form.get('search_term', ''))
 
     the_data = []
     response = {
@@ -99,50 +118,17 @@ def search_venues():
 
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}')
+@replica_router.read_only
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-    the_venue = Venue.query.get(venue_id)
-
-    upcoming_shows = []
-    past_shows = []
-    all_shows = the_venue.shows
-    for show in all_shows:
-        if str(show.start_time) > current_time:
-            upcoming_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": str(show.start_time)
-            })
-        else:
-            past_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": str(show.start_time)
-            })
-    genres = ','.join(the_venue.genres)
-
-    data = {
-        "id": the_venue.id,
-        "name": the_venue.name,
-        "genres": genres.split(','),
-        "address": the_venue.address,
-        "city": the_venue.city,
-        "state": the_venue.state,
-        "phone": the_venue.phone,
-        "website": the_venue.website,
-        "facebook_link": the_venue.facebook_link,
-        "seeking_talent": the_venue.seeking_talent,
-        "seeking_description": the_venue.seeking_description,
-        "image_link": the_venue.image_link,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
-    }
+    data = venue_detail(venue_id, current_time())
+    if data is None:
+        abort(404)
+    page_cache.add_tags(*{f"artist:{show['artist_id']}" for show in data['upcoming_shows'] + data['past_shows']})
+    if data['upcoming_shows']:
+        page_cache.expire_at(datetime.fromisoformat(data['upcoming_shows'][0]['start_time']).timestamp())
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -180,7 +166,12 @@ def create_venue_submission():
     if form.validate_on_submit():
         try:
             db.session.add(venue)
+            db.session.flush()
+            venue_id = venue.id
             db.session.commit()
+            area_index.put(venue_id, form.name.data, form.city.data, form.state.data)
+            suggest_index.put('venue', venue_id, form.name.data)
+            page_cache.invalidate('venues')
             # on successful db insert, flash success
             flash(f'Venue {form.name.data} was successfully listed!')
         except:
@@ -196,22 +187,26 @@ def create_venue_submission():
         return redirect(url_for('create_venue_submission'))
 
 
-@app.route('/venues/<venue_id>/delete', methods=['GET'])
+@app.route('/venues/<int:venue_id>/delete', methods=['GET'])
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
-    venue = Venue.query.get(venue_id)
-    venue_name = venue.name
+    # hidden right away; its shows are deleted in batches by the purge worker (deletion.py)
     try:
-        db.session.delete(venue)
-        db.session.commit()
-        flash(f'Venue {venue_name} was successfully deleted!')
+        venue_name = soft_delete(Venue, venue_id)
     except:
         db.session.rollback()
-        flash(f'please try again. Venue {venue_name} could not be deleted.')
+        flash(f'please try again. Venue {venue_id} could not be deleted.')
+        return redirect(url_for('index'))
     finally:
         db.session.close()
+    if venue_name is None:
+        abort(404)
+    area_index.remove(venue_id)
+    suggest_index.remove('venue', venue_id)
+    purge_worker.schedule(Venue, venue_id)
+    flash(f'Venue {venue_name} was successfully deleted!')
 
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button deletes it from the db then redirect the user to the homepage
@@ -221,26 +216,23 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached('artists')
+@replica_router.read_only
 def artists():
     # TODO: replace with real data returned from querying the database
-    the_artist = Artist.query.order_by(Artist.name).all()
-
-    data = []
-    for artist in the_artist:
-        details = {
-            "id": artist.id,
-            "name": artist.name
-        }
-        data.append(details)
-    return render_template('pages/artists.html', artists=data)
+    filters = parse_filters(request.args)
+    data = artist_directory(**filters)
+    return render_template('pages/artists.html', artists=data, filters=filter_args(filters),
+                           facets=facet_cache.get(Artist, filters))
 
 
 @app.route('/artists/search', methods=['POST'])
+@replica_router.read_only
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # search for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
-    the_artists = Artist.query.filter(Artist.name.ilike('%' + request.form.get('search_term', '').strip() + '%')).all()
+    the_artists = search(Artist, request.form.get('search_term', ''))
 
     the_data = []
     response = {
@@ -259,63 +251,48 @@ def search_artists():
 
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}')
+@replica_router.read_only
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # TODO: replace with real artist data from the artist table, using artist_id
-    artist = Artist.query.get(artist_id)
-
-    upcoming_shows = []
-    past_shows = []
-
-    upcoming_shows_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-        Show.start_time > datetime.now()).all()
-    past_shows_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(
-        Show.start_time < datetime.now()).all()
-
-    for the_show in upcoming_shows_query:
-        upcoming_shows.append({
-            "venue_id": the_show.venue_id,
-            "venue_name": the_show.venue.name,
-            "venue_image_link": the_show.venue.image_link,
-            "start_time": str(the_show.start_time)
-        })
-    for the_show in past_shows_query:
-        past_shows.append({
-            "venue_id": the_show.venue_id,
-            "venue_name": the_show.venue.name,
-            "venue_image_link": the_show.venue.image_link,
-            "start_time": str(the_show.start_time)
-        })
-
-    genres = ','.join(artist.genres)
-
-    data1 = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": genres.split(','),
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "website": artist.website,
-        "facebook_link": artist.facebook_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "image_link": artist.image_link,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
-    }
+    data1 = artist_detail(artist_id, current_time())
+    if data1 is None:
+        abort(404)
+    page_cache.add_tags(*{f"venue:{show['venue_id']}" for show in data1['upcoming_shows'] + data1['past_shows']})
+    if data1['upcoming_shows']:
+        page_cache.expire_at(datetime.fromisoformat(data1['upcoming_shows'][0]['start_time']).timestamp())
 
     return render_template('pages/show_artist.html', artist=data1)
 
 
+@app.route('/artists/<int:artist_id>/delete', methods=['GET'])
+def delete_artist(artist_id):
+    # same as delete_venue
+    try:
+        artist_name = soft_delete(Artist, artist_id)
+    except:
+        db.session.rollback()
+        flash(f'please try again. Artist {artist_id} could not be deleted.')
+        return redirect(url_for('index'))
+    finally:
+        db.session.close()
+    if artist_name is None:
+        abort(404)
+    suggest_index.remove('artist', artist_id)
+    purge_worker.schedule(Artist, artist_id)
+    flash(f'Artist {artist_name} was successfully deleted!')
+    return redirect(url_for('index'))
+
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
-    the_artist = Artist.query.get(artist_id)
+    the_artist = entity_cache.get(Artist, artist_id)
+    if the_artist is None:
+        abort(404)
     artist_information = {
         "id": the_artist.id,
         "name": the_artist.name,
@@ -334,7 +311,7 @@ def edit_artist(artist_id):
     form.city.data = the_artist.city
     form.state.data = the_artist.state
     form.phone.data = the_artist.phone
-    form.genres.data = the_artist.genres
+    form.genres.data = list(the_artist.genres)
     form.facebook_link.data = the_artist.facebook_link
     form.image_link.data = the_artist.image_link
     form.website_link.data = the_artist.website
@@ -349,28 +326,41 @@ def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     form = ArtistForm(request.form)
 
-    the_artist = Artist.query.get(artist_id)
-    the_artist.name = form.name.data
-    the_artist.state = form.state.data
-    the_artist.city = form.city.data
-    the_artist.phone = form.phone.data
-    the_artist.image_link = form.image_link.data
-    the_artist.seeking_description = form.seeking_description.data
-    the_artist.facebook_link = form.facebook_link.data
-    the_artist.seeking_venue = True if 'seeking_venue' in request.form else False
-    the_artist.genres = request.form.getlist('genres')
-    the_artist.website = form.website_link.data
+    changes = {
+        "name": form.name.data,
+        "state": form.state.data,
+        "city": form.city.data,
+        "phone": form.phone.data,
+        "image_link": form.image_link.data,
+        "seeking_description": form.seeking_description.data,
+        "facebook_link": form.facebook_link.data,
+        "seeking_venue": True if 'seeking_venue' in request.form else False,
+        "genres": request.form.getlist('genres'),
+        "website": form.website_link.data
+    }
 
     if form.validate_on_submit():
+        artist_name = None
         try:
-            db.session.commit()
-            flash(f"Artist {the_artist.name} updated successfully")
+            # a single UPDATE by id, without loading the artist first
+            artist_name = db.session.execute(
+                update(Artist).where(Artist.id == artist_id, Artist.deleted_at.is_(None))
+                .values(**changes).returning(Artist.name)
+            ).scalar()
+            if artist_name is not None:
+                entity_cache.changed(db.session, Artist, artist_id)
+                db.session.commit()
+                suggest_index.put('artist', artist_id, artist_name)
+                page_cache.invalidate('artists', f'artist:{artist_id}')
+                flash(f"Artist {artist_name} updated successfully")
         except:
             db.session.rollback()
-
-            flash(f"Artist {the_artist.name} did not update successfully")
+            artist_name = changes['name']
+            flash(f"Artist {artist_name} did not update successfully")
         finally:
             db.session.close()
+        if artist_name is None:
+            abort(404)
         return redirect(url_for('show_artist', artist_id=artist_id))
     else:
         flash(form.errors)
@@ -381,12 +371,14 @@ def edit_artist_submission(artist_id):
 def edit_venue(venue_id):
     form = VenueForm()
 
-    the_venue = Venue.query.get(venue_id)
+    the_venue = entity_cache.get(Venue, venue_id)
+    if the_venue is None:
+        abort(404)
 
     venue = {
         "id": the_venue.id,
         "name": the_venue.name,
-        "genres": the_venue.genres,
+        "genres": list(the_venue.genres),
         "address": the_venue.address,
         "city": the_venue.city,
         "state": the_venue.state,
@@ -402,7 +394,7 @@ def edit_venue(venue_id):
     form.city.data = the_venue.city
     form.state.data = the_venue.state
     form.phone.data = the_venue.phone
-    form.genres.data = the_venue.genres
+    form.genres.data = list(the_venue.genres)
     form.facebook_link.data = the_venue.facebook_link
     form.address.data = the_venue.address
     form.image_link.data = the_venue.image_link
@@ -419,29 +411,43 @@ def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
     form = VenueForm(request.form)
 
-    edited_venue = Venue.query.get(venue_id)
-    edited_venue.name = form.name.data
-    edited_venue.state = form.state.data
-    edited_venue.city = form.city.data
-    edited_venue.phone = form.phone.data
-    edited_venue.image_link = form.image_link.data
-    edited_venue.seeking_description = form.seeking_description.data
-    edited_venue.address = form.address.data
-    edited_venue.facebook_link = form.facebook_link.data
-    edited_venue.seeking_talent = True if 'seeking_talent' in request.form else False
-    edited_venue.genres = request.form.getlist('genres')
-    edited_venue.website = form.website_link.data
+    changes = {
+        "name": form.name.data,
+        "state": form.state.data,
+        "city": form.city.data,
+        "phone": form.phone.data,
+        "image_link": form.image_link.data,
+        "seeking_description": form.seeking_description.data,
+        "address": form.address.data,
+        "facebook_link": form.facebook_link.data,
+        "seeking_talent": True if 'seeking_talent' in request.form else False,
+        "genres": request.form.getlist('genres'),
+        "website": form.website_link.data
+    }
 
     if form.validate_on_submit():
+        venue_name = None
         try:
-            db.session.commit()
-            flash(f"Venue {edited_venue.name} updated successfully")
+            # a single UPDATE by id, without loading the venue first
+            venue_name = db.session.execute(
+                update(Venue).where(Venue.id == venue_id, Venue.deleted_at.is_(None))
+                .values(**changes).returning(Venue.name)
+            ).scalar()
+            if venue_name is not None:
+                entity_cache.changed(db.session, Venue, venue_id)
+                db.session.commit()
+                area_index.put(venue_id, form.name.data, form.city.data, form.state.data)
+                suggest_index.put('venue', venue_id, form.name.data)
+                page_cache.invalidate('venues', f'venue:{venue_id}')
+                flash(f"Venue {venue_name} updated successfully")
         except:
             db.session.rollback()
-
-            flash(f"Venue {edited_venue.name} did not update successfully")
+            venue_name = changes['name']
+            flash(f"Venue {venue_name} did not update successfully")
         finally:
             db.session.close()
+        if venue_name is None:
+            abort(404)
 
         return redirect(url_for('show_venue', venue_id=venue_id))
     else:
@@ -485,7 +491,11 @@ def create_artist_submission():
 
         try:
             db.session.add(artist)
+            db.session.flush()
+            artist_id = artist.id
             db.session.commit()
+            suggest_index.put('artist', artist_id, form.name.data)
+            page_cache.invalidate('artists')
             # on successful db insert, flash success
             flash(f'Artist {form.name.data} was successfully listed!')
         except:
@@ -500,15 +510,47 @@ def create_artist_submission():
         return redirect(url_for('create_artist_submission'))
 
 
+#  Suggestions
+#  ----------------------------------------------------------------
+
+@app.route('/api/search/suggest')
+def search_suggest():
+    # typeahead for the venue/artist search boxes, served from the in-process prefix index
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    suggestions = suggest_index.suggest(request.args.get('q', ''), limit)
+    return jsonify(venues=suggestions['venue'], artists=suggestions['artist'])
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify({**page_cache.stats(), "entities": entity_cache.stats()})
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached('shows', 'venues', 'artists')
+@replica_router.read_only
 def shows():
     # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    data = Show.query.all()
-    return render_template('pages/shows.html', shows=data)
+    # keyset-paginated: ?after=<cursor>, optionally filtered with ?upcoming=1 and ?start=/?end= (YYYY-MM-DD, end exclusive)
+    filters = {
+        "upcoming": request.args.get('upcoming', 0, type=int),
+        "start": request.args.get('start', ''),
+        "end": request.args.get('end', '')
+    }
+    data, next_cursor = shows_page(
+        after=request.args.get('after'),
+        upcoming_only=bool(filters['upcoming']),
+        start=request.args.get('start', type=datetime.fromisoformat),
+        end=request.args.get('end', type=datetime.fromisoformat),
+        limit=app.config.get('SHOWS_PAGE_SIZE', 30)
+    )
+    for show, start_time in zip(data, format_datetimes([show['start_time'] for show in data], 'full')):
+        show['start_time_full'] = start_time
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor,
+                           filters={key: value for key, value in filters.items() if value})
 
 
 @app.route('/shows/create')
@@ -523,17 +565,38 @@ def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
     form = ShowForm(request.form)
+    if not form.validate_on_submit():
+        flash(form.errors)
+        return render_template('forms/new_show.html', form=form)
 
     show = Show()
     show.artist_id = form.artist_id.data
     show.venue_id = form.venue_id.data
     show.start_time = form.start_time.data
+    show.duration = form.duration.data or DEFAULT_SHOW_DURATION
 
+    # deleted venues and artists can no longer be booked
+    unknown = owner_errors(show.venue_id, show.artist_id)
+    if unknown:
+        flash(unknown)
+        return render_template('forms/new_show.html', form=form)
+
+    conflicts = {}
     try:
-        db.session.add(show)
-        db.session.commit()
-        # on successful db insert, flash success
-        flash('Show was successfully listed!')
+        # double bookings come back to the form instead of failing the insert
+        conflicts = find_conflicts(show.venue_id, show.artist_id, show.start_time, show.duration)
+        if not conflicts:
+            db.session.add(show)
+            db.session.commit()
+            page_cache.invalidate('shows', f'venue:{form.venue_id.data}', f'artist:{form.artist_id.data}')
+            # on successful db insert, flash success
+            flash('Show was successfully listed!')
+    except IntegrityError as error:
+        db.session.rollback()
+        if is_booking_violation(error):
+            conflicts = {'start_time': ['The venue or the artist has just been booked for this time.']}
+        else:
+            flash('An error occurred. Show could not be listed.')
     # TODO: on unsuccessful db insert, flash an error instead.
     except:
         db.session.rollback()
@@ -541,9 +604,65 @@ def create_show_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     finally:
         db.session.close()
+    if conflicts:
+        flash(conflicts)
+        return render_template('forms/new_show.html', form=form), 409
     return redirect(url_for('index'))
 
 
+#  Tours
+#  ----------------------------------------------------------------
+
+@app.route('/tours/create')
+def create_tour_form():
+    form = TourForm()
+    return render_template('forms/new_tour.html', form=form, results=None)
+
+
+@app.route('/tours/create', methods=['POST'])
+def create_tour_submission():
+    # many shows for one artist in one transaction; every line gets its own result
+    form = TourForm(request.form)
+    if not form.validate_on_submit():
+        flash(form.errors)
+        return render_template('forms/new_tour.html', form=form, results=None)
+    rows = parse_tour_lines(form.shows.data)
+    if len(rows) > app.config.get('TOUR_MAX_SHOWS', 200):
+        flash(f"A tour can list at most {app.config.get('TOUR_MAX_SHOWS', 200)} shows.")
+        return render_template('forms/new_tour.html', form=form, results=None)
+
+    try:
+        results = create_tour(form.artist_id.data, rows)
+    except:
+        db.session.rollback()
+        flash('An error occurred. The tour could not be listed.')
+        return render_template('forms/new_tour.html', form=form, results=None)
+    finally:
+        db.session.close()
+    created = sum(1 for result in results if result['status'] == 'created')
+    flash(f'{created} of {len(results)} shows were successfully listed!')
+    return render_template('forms/new_tour.html', form=form, results=results)
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):entity>.<any(csv, jsonl):fmt>')
+@replica_router.read_only
+def export(entity, fmt):
+    # streams the whole table; ?city= / ?state= / ?start= / ?end= (shows, YYYY-MM-DD, end exclusive) filter in SQL
+    filters = {
+        "city": request.args.get('city'),
+        "state": request.args.get('state'),
+    }
+    if entity == 'shows':
+        filters['start'] = request.args.get('start', type=datetime.fromisoformat)
+        filters['end'] = request.args.get('end', type=datetime.fromisoformat)
+    response = Response(stream_with_context(export_chunks(entity, fmt, **filters)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={entity}.{fmt}'
+    return response
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,74 @@
+"""Per-call cost of the `datetime` Jinja filter, before and after formatting.py.
+
+    python -m benchmarks.format_datetime_bench [--count 10000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from formatting import format_datetime, format_datetimes, _format
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was in app.py
+    if isinstance(value, str):
+        date = dateutil.parser.parse(value)
+    else:
+        date = value
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def timestamps(count, distinct):
+    start = datetime(2022, 1, 1, 18, 0)
+    pool = [start + timedelta(minutes=30 * random.randrange(50000)) for _ in range(distinct)]
+    return [random.choice(pool) for _ in range(count)]
+
+
+def per_call(function, values):
+    started = time.perf_counter()
+    for value in values:
+        function(value, 'full')
+    return (time.perf_counter() - started) / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=2000,
+                        help='distinct timestamps among the formatted values')
+    options = parser.parse_args()
+
+    random.seed(1)
+    values = timestamps(options.count, options.distinct)
+    strings = [str(value) for value in values]
+    assert all(legacy_format_datetime(value, 'full') == format_datetime(value, 'full') for value in values[:500])
+
+    rows = [
+        ('legacy, str input', per_call(legacy_format_datetime, strings)),
+        ('legacy, datetime input', per_call(legacy_format_datetime, values)),
+    ]
+    _format.cache_clear()
+    rows.append(('filter, str input, cold memo', per_call(format_datetime, strings)))
+    rows.append(('filter, str input, warm memo', per_call(format_datetime, strings)))
+    _format.cache_clear()
+    rows.append(('filter, datetime input, cold memo', per_call(format_datetime, values)))
+
+    started = time.perf_counter()
+    format_datetimes(strings, 'full')
+    rows.append(('format_datetimes batch, str input', (time.perf_counter() - started) / len(strings) * 1e6))
+
+    print(f'{options.count} timestamps, {options.distinct} distinct')
+    for label, micros in rows:
+        print(f'  {label:<36} {micros:8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
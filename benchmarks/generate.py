@@ -0,0 +1,143 @@
+"""Fill the configured database with a synthetic Fyyur dataset.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench \\
+        python -m benchmarks.generate --venues 10000 --artists 50000 --shows 2000000
+
+Run `flask db upgrade` on a scratch database first; rows are appended to
+whatever is already there.
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from app import app
+from bookings import BookingIndex
+from counters import apply_show_delta
+from forms import VenueForm
+from importer import _copy_shows
+from loaders import current_time
+from models import db, Venue, Artist, Show
+
+STATES = [value for value, label in VenueForm.state.kwargs['choices']]
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+
+# a few large cities and a long tail of small ones, like real listings
+BIG_CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'San Francisco', 'Seattle', 'Austin']
+WORDS = ['Blue', 'Velvet', 'Underground', 'Moon', 'Hop', 'Square', 'Live', 'Hall', 'Room', 'Garden', 'Echo',
+         'Lounge', 'Electric', 'Golden', 'Wild', 'Sax', 'Petals', 'Band', 'Collective', 'Riot', 'Sound', 'Station',
+         'Mercury', 'Neon', 'Harbor', 'Basement', 'Attic', 'Owl', 'Fox', 'Crown', 'Union', 'Palace']
+
+
+def _name(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, words)))
+
+
+def _city(rng, small_cities):
+    if rng.random() < 0.4:
+        return rng.choice(BIG_CITIES), None
+    return rng.choice(small_cities)
+
+
+def _owner_rows(rng, count, is_venue, small_cities):
+    for number in range(count):
+        city, state = _city(rng, small_cities)
+        row = {
+            "name": f'{"The " if is_venue and rng.random() < 0.3 else ""}{_name(rng)} {number}',
+            "city": city,
+            "state": state or rng.choice(STATES),
+            "phone": f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            "image_link": f'https://images.example.com/{number}.jpg',
+            "facebook_link": f'https://www.facebook.com/{number}',
+            "website": f'https://example.com/{number}',
+            "genres": rng.sample(GENRES, rng.randint(1, 3)),
+            "seeking_description": 'Looking for new acts' if rng.random() < 0.3 else None,
+            "upcoming_shows_count": 0,
+            "past_shows_count": 0,
+        }
+        if is_venue:
+            row.update(address=f'{rng.randint(1, 9999)} {_name(rng, 1)} St', seeking_talent=rng.random() < 0.3)
+        else:
+            row['seeking_venue'] = rng.random() < 0.3
+        yield row
+
+
+def _insert_owners(model, rows, batch_size):
+    table = model.__table__
+    ids = []
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            ids += db.session.execute(insert(table).returning(table.c.id), batch).scalars().all()
+            batch = []
+    if batch:
+        ids += db.session.execute(insert(table).returning(table.c.id), batch).scalars().all()
+    db.session.commit()
+    return ids
+
+
+def _insert_shows(rng, count, venue_ids, artist_ids, batch_size, now):
+    # about 90% of shows are in the past three years, the rest in the next one;
+    # slots that would double-book a venue or artist are drawn again
+    connection = db.session.connection()
+    counts = {(model, upcoming): Counter() for model in (Venue, Artist) for upcoming in (True, False)}
+    bookings = BookingIndex()
+    batch = []
+    for number in range(count):
+        while True:
+            if rng.random() < 0.9:
+                start_time = now - timedelta(minutes=rng.randint(1, 3 * 365 * 24 * 60))
+            else:
+                start_time = now + timedelta(minutes=rng.randint(1, 365 * 24 * 60))
+            row = {
+                "venue_id": rng.choice(venue_ids),
+                "artist_id": rng.choice(artist_ids),
+                "start_time": start_time.replace(second=0, microsecond=0),
+                "duration": rng.choice((60, 90, 120, 180)),
+                "upcoming": start_time > now,
+            }
+            if not bookings.book(row['venue_id'], row['artist_id'], row['start_time'], row['duration']):
+                break
+        counts[Venue, row['upcoming']][row['venue_id']] += 1
+        counts[Artist, row['upcoming']][row['artist_id']] += 1
+        batch.append(row)
+        if len(batch) >= batch_size or number == count - 1:
+            if not _copy_shows(connection, batch):
+                connection.execute(insert(Show.__table__), batch)
+            batch = []
+    # counters are applied once at the end rather than per row
+    for model in (Venue, Artist):
+        apply_show_delta(connection, model, upcoming=counts[model, True], past=counts[model, False])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=2000000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    small_cities = [(f'{_name(rng, 2)}ville', rng.choice(STATES)) for _ in range(max(10, options.venues // 5))]
+
+    with app.app_context():
+        started = time.perf_counter()
+        venue_ids = _insert_owners(Venue, _owner_rows(rng, options.venues, True, small_cities), options.batch_size)
+        artist_ids = _insert_owners(Artist, _owner_rows(rng, options.artists, False, small_cities),
+                                    options.batch_size)
+        print(f'{len(venue_ids)} venues, {len(artist_ids)} artists in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        _insert_shows(rng, options.shows, venue_ids, artist_ids, options.batch_size, current_time())
+        print(f'{options.shows} shows in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
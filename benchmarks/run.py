@@ -0,0 +1,249 @@
+"""Benchmark every read route and record latency, throughput and queries.
+
+    python -m benchmarks.run --output benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+    python -m benchmarks.run --url http://localhost:5000 --concurrency 16
+    python -m benchmarks.run --output - > benchmarks/staging.json
+
+By default requests go through the Flask test client, one at a time, and the
+SQL statements of each request are counted. With --url the same routes are
+driven over HTTP by a pool of threads against a running server; queries are
+not counted in that mode. Routes that write (create, edit, delete, import)
+are left out so runs are repeatable against the same dataset.
+
+Baselines are specific to the machine and dataset. A local baseline.json is
+not committed; staging.json, recorded on the staging app with
+`fab staging_baseline`, is, so `fab heroku_test` has something to compare
+against. A missing --compare file is an error. `--output -` writes the report to
+stdout and prints nothing else.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue, Artist, Show
+from page_cache import page_cache
+
+# name -> (method, path, form data); {venue}, {artist}, {show}, {term} and
+# {genre} are filled from the dataset
+ROUTES = {
+    'index': ('GET', '/', None),
+    'venues': ('GET', '/venues', None),
+    'venues_genre': ('GET', '/venues?genre={genre}', None),
+    'venue': ('GET', '/venues/{venue}', None),
+    'venue_search': ('POST', '/venues/search', {'search_term': '{term}'}),
+    'venue_edit_form': ('GET', '/venues/{venue}/edit', None),
+    'venue_create_form': ('GET', '/venues/create', None),
+    'artists': ('GET', '/artists', None),
+    'artists_genre': ('GET', '/artists?genre={genre}', None),
+    'artist': ('GET', '/artists/{artist}', None),
+    'artist_search': ('POST', '/artists/search', {'search_term': '{term}'}),
+    'artist_edit_form': ('GET', '/artists/{artist}/edit', None),
+    'artist_create_form': ('GET', '/artists/create', None),
+    'shows': ('GET', '/shows', None),
+    'shows_upcoming': ('GET', '/shows?upcoming=1', None),
+    'show_create_form': ('GET', '/shows/create', None),
+    'suggest': ('GET', '/api/search/suggest?q={term}', None),
+    'api_venues': ('GET', '/api/v1/venues', None),
+    'api_venue': ('GET', '/api/v1/venues/{venue}', None),
+    'api_artists': ('GET', '/api/v1/artists', None),
+    'api_artist': ('GET', '/api/v1/artists/{artist}', None),
+    'api_shows': ('GET', '/api/v1/shows', None),
+    'api_show': ('GET', '/api/v1/shows/{show}', None),
+    'export_venues': ('GET', '/export/venues.csv', None),
+}
+
+
+def _sample_values():
+    # the busiest venue and artist, so detail pages show their worst case
+    venue = Venue.query.order_by((Venue.upcoming_shows_count + Venue.past_shows_count).desc()).first()
+    artist = Artist.query.order_by((Artist.upcoming_shows_count + Artist.past_shows_count).desc()).first()
+    show = Show.query.order_by(Show.id.desc()).first()
+    if venue is None or artist is None or show is None:
+        sys.exit('The database has no data; run python -m benchmarks.generate first.')
+    return {
+        'venue': venue.id,
+        'artist': artist.id,
+        'show': show.id,
+        'term': venue.name.split()[0],
+        'genre': (venue.genres or ['Jazz'])[0]
+    }
+
+
+def _fill(route, values):
+    method, path, data = route
+    quoted = {key: urllib.parse.quote(str(value)) for key, value in values.items()}
+    path = path.format(**quoted)
+    if data is not None:
+        data = {key: value.format(**values) for key, value in data.items()}
+    return method, path, data
+
+
+def summarize(latencies, seconds, queries=None):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "throughput_rps": round(len(latencies) / seconds, 1) if seconds else None,
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else None
+    }
+
+
+def run_client(routes, requests, warmup, verbose=True):
+    # sequential requests through the test client; statements are counted per request
+    counter = [0]
+
+    def count(*args):
+        counter[0] += 1
+
+    client = app.test_client()
+    results = {}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        for name, (method, path, data) in routes.items():
+            for _ in range(warmup):
+                client.open(path, method=method, data=data)
+            latencies = []
+            queries = []
+            started = time.perf_counter()
+            for _ in range(requests):
+                counter[0] = 0
+                begin = time.perf_counter()
+                response = client.open(path, method=method, data=data)
+                response.get_data()
+                latencies.append(time.perf_counter() - begin)
+                queries.append(counter[0])
+                if response.status_code >= 400:
+                    sys.exit(f'{name}: {method} {path} returned {response.status_code}')
+            results[name] = summarize(latencies, time.perf_counter() - started, queries)
+            if verbose:
+                print(f"{name:20} {results[name]['p50_ms']:9.2f} {results[name]['p95_ms']:9.2f} "
+                      f"{results[name]['p99_ms']:9.2f} {results[name]['queries_per_request']:7.1f}")
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count)
+    return results
+
+
+def _http_request(url, method, data):
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    begin = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(url, data=body, method=method)) as response:
+        response.read()
+    return time.perf_counter() - begin
+
+
+def run_http(base_url, routes, requests, warmup, concurrency, verbose=True):
+    # `requests` per route spread over `concurrency` threads
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, (method, path, data) in routes.items():
+            url = base_url.rstrip('/') + path
+            list(pool.map(lambda _: _http_request(url, method, data), range(warmup)))
+            started = time.perf_counter()
+            latencies = list(pool.map(lambda _: _http_request(url, method, data), range(requests)))
+            results[name] = summarize(latencies, time.perf_counter() - started)
+            if verbose:
+                print(f"{name:20} {results[name]['p50_ms']:9.2f} {results[name]['p95_ms']:9.2f} "
+                      f"{results[name]['p99_ms']:9.2f} {results[name]['throughput_rps']:9.1f} req/s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # a route regresses when its p95 grows beyond the tolerance or it issues more queries
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        limit = previous['p95_ms'] * (1 + tolerance)
+        if current['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']:.2f}ms > {previous['p95_ms']:.2f}ms "
+                               f"(+{tolerance:.0%} allowed)")
+        if (current['queries_per_request'] is not None and previous.get('queries_per_request') is not None
+                and current['queries_per_request'] > previous['queries_per_request']):
+            regressions.append(f"{name}: {current['queries_per_request']} queries per request, "
+                               f"was {previous['queries_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per route')
+    parser.add_argument('--url', help='benchmark a running server over HTTP instead of the test client')
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP client threads (with --url)')
+    parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='only run these routes')
+    parser.add_argument('--no-page-cache', action='store_true', help='disable the rendered page cache')
+    parser.add_argument('--output', help='write the results to this JSON file, or - for stdout')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown, 0.2 = 20%%')
+    options = parser.parse_args()
+    if options.compare and not os.path.exists(options.compare):
+        parser.error(f'no baseline at {options.compare}; record one with --output first')
+    verbose = options.output != '-'
+    if options.compare and not verbose:
+        parser.error('--output - cannot be combined with --compare')
+
+    if options.no_page_cache:
+        page_cache.enabled = False
+    with app.app_context():
+        values = _sample_values()
+    routes = {name: _fill(ROUTES[name], values) for name in (options.route or ROUTES)}
+
+    if verbose:
+        print(f"{'route':20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    if options.url:
+        results = run_http(options.url, routes, options.requests, options.warmup, options.concurrency, verbose)
+    else:
+        results = run_client(routes, options.requests, options.warmup, verbose)
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "mode": 'http' if options.url else 'client',
+            "concurrency": options.concurrency if options.url else 1,
+            "page_cache": None if options.url else page_cache.enabled,
+            "python": platform.python_version(),
+            "samples": values
+        },
+        "routes": results
+    }
+    if not verbose:
+        json.dump(report, sys.stdout, indent=2)
+    elif options.output:
+        with open(options.output, 'w') as target:
+            json.dump(report, target, indent=2)
+        print(f'results written to {options.output}')
+
+    if options.compare:
+        with open(options.compare) as source:
+            regressions = compare(results, json.load(source), options.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import func, literal, literal_column, or_, select, text, union_all
+
+from loaders import live
+from models import db, Venue, Artist, Show, MAX_SHOW_DURATION
+
+
+# ----------------------------------------------------------------------------#
+# Show bookings.
+# ----------------------------------------------------------------------------#
+
+# A show books its venue and its artist from start_time for `duration`
+# minutes. The database refuses overlapping bookings through the exclusion
+# constraints of each shows partition (models.booking_constraints). Those
+# cannot see across partitions, so the write paths also check for conflicts
+# themselves, which covers shows that run past the end of a month and turns
+# conflicts into form errors. The check holds a transaction-level advisory
+# lock per venue and artist, so two requests cannot both pass it for the same
+# slot. The web form asks the database (find_conflicts); bulk paths load the
+# bookings of a whole batch once into a BookingIndex and check in memory.
+
+_VENUE_LOCK, _ARTIST_LOCK = 1, 2
+
+EXCLUSION_VIOLATION = '23P01'
+
+
+class _Node:
+    __slots__ = ('start', 'end', 'value', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, value):
+        self.start = start
+        self.end = end
+        self.value = value
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+
+class IntervalTree:
+    # Half-open [start, end) intervals in a treap ordered by start, each node
+    # also holding the largest end in its subtree. add() and overlapping() take
+    # O(log n) expected time, plus the number of matches. Like Postgres ranges,
+    # empty intervals overlap nothing and are not stored.
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, start, end, value=None):
+        if end <= start:
+            return
+        self.root = self._insert(self.root, _Node(start, end, value))
+        self.size += 1
+
+    def overlapping(self, start, end):
+        # values of the stored intervals that overlap [start, end)
+        found = []
+        if end <= start:
+            return found
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.start < end:
+                if node.end > start:
+                    found.append(node.value)
+                stack.append(node.right)
+        return found
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if new.start < node.start:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                return self._rotate(node, node.left)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                return self._rotate(node, node.right)
+        node.max_end = max(node.max_end, new.end)
+        return node
+
+    @staticmethod
+    def _rotate(node, child):
+        # lifts child above node
+        if child is node.left:
+            node.left, child.right = child.right, node
+        else:
+            node.right, child.left = child.left, node
+        for current in (node, child):
+            current.max_end = max([current.end] + [side.max_end for side in (current.left, current.right) if side])
+        return child
+
+
+def known_owners(venue_ids, artist_ids):
+    # (venue ids, artist ids) of those that exist and are not deleted, from a single query
+    rows = db.session.execute(union_all(
+        select(literal('venue'), Venue.id).where(Venue.id.in_(sorted(venue_ids)), live(Venue)),
+        select(literal('artist'), Artist.id).where(Artist.id.in_(sorted(artist_ids)), live(Artist))
+    )).all()
+    return {owner_id for kind, owner_id in rows if kind == 'venue'}, \
+        {owner_id for kind, owner_id in rows if kind == 'artist'}
+
+
+def owner_errors(venue_id, artist_id):
+    # form-style errors for a venue or artist that is unknown or deleted
+    venue_id, artist_id = str(venue_id).strip(), str(artist_id).strip()
+    venues, artists = known_owners([int(venue_id)] if venue_id.isdigit() else [],
+                                   [int(artist_id)] if artist_id.isdigit() else [])
+    errors = {}
+    if not venue_id.isdigit() or int(venue_id) not in venues:
+        errors['venue_id'] = ['Unknown venue.']
+    if not artist_id.isdigit() or int(artist_id) not in artists:
+        errors['artist_id'] = ['Unknown artist.']
+    return errors
+
+
+def booked_range(table=Show.__table__):
+    # the same expression as BOOKED_RANGE, so lookups can use the constraints' indexes
+    return func.tsrange(table.c.start_time,
+                        table.c.start_time + table.c.duration * literal_column("interval '1 minute'"))
+
+
+def lock_bookings(connection, venue_ids=(), artist_ids=()):
+    # held until the transaction ends; taken in one order everywhere so that
+    # overlapping batches cannot deadlock
+    keys = sorted({(_VENUE_LOCK, int(venue_id)) for venue_id in venue_ids}
+                  | {(_ARTIST_LOCK, int(artist_id)) for artist_id in artist_ids})
+    if keys:
+        connection.execute(text('SELECT pg_advisory_xact_lock(:kind, :id)'),
+                           [{"kind": kind, "id": owner_id} for kind, owner_id in keys])
+
+
+def booking_rows(connection, venue_ids, artist_ids, lower, upper):
+    # shows of those venues or artists that overlap [lower, upper)
+    shows = Show.__table__
+    return connection.execute(
+        select(shows.c.id, shows.c.venue_id, shows.c.artist_id, shows.c.start_time, shows.c.duration)
+        .where(
+            or_(shows.c.venue_id.in_(venue_ids), shows.c.artist_id.in_(artist_ids)),
+            booked_range().op('&&')(func.tsrange(lower, upper)),
+            # a show starting earlier than this has ended by `lower`; bounds
+            # the partitions that are read
+            shows.c.start_time > lower - timedelta(minutes=MAX_SHOW_DURATION),
+            shows.c.start_time < upper
+        )
+    ).all()
+
+
+def conflict_errors(venue_id, artist_id, conflicts):
+    # form-style errors for the bookings a proposed show collides with;
+    # conflicts are (show id or None, venue_id, artist_id, start_time, duration)
+    errors = defaultdict(list)
+    for show_id, other_venue_id, other_artist_id, other_start, other_duration in conflicts:
+        booked = f'{other_start:%Y-%m-%d %H:%M} to {other_start + timedelta(minutes=other_duration):%H:%M}' \
+            + (f' (show {show_id})' if show_id else ' by an earlier row')
+        if other_venue_id == venue_id:
+            errors['venue_id'].append(f'Venue {venue_id} is already booked from {booked}.')
+        if other_artist_id == artist_id:
+            errors['artist_id'].append(f'Artist {artist_id} is already booked from {booked}.')
+    return dict(errors)
+
+
+def find_conflicts(venue_id, artist_id, start_time, duration):
+    # Locks the venue and artist for the rest of the transaction and returns
+    # form-style errors for the shows the booking would overlap ({} if none).
+    venue_id, artist_id = int(venue_id), int(artist_id)
+    connection = db.session.connection()
+    lock_bookings(connection, [venue_id], [artist_id])
+    rows = booking_rows(connection, [venue_id], [artist_id], start_time,
+                        start_time + timedelta(minutes=duration))
+    return conflict_errors(venue_id, artist_id, rows)
+
+
+def is_booking_violation(error):
+    # an IntegrityError raised by one of the booking exclusion constraints
+    return getattr(error.orig, 'sqlstate', None) == EXCLUSION_VIOLATION \
+        or getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+class BookingIndex:
+    # Bookings per venue and per artist in interval trees: first the existing
+    # shows of a batch's venues and artists (one query), then every slot
+    # accepted from the batch, so later rows are checked against earlier ones.
+
+    def __init__(self):
+        self.venues = defaultdict(IntervalTree)
+        self.artists = defaultdict(IntervalTree)
+
+    def load(self, connection, rows):
+        # rows: dicts with venue_id, artist_id, start_time and duration
+        if not rows:
+            return
+        lower = min(row['start_time'] for row in rows)
+        upper = max(row['start_time'] + timedelta(minutes=row['duration']) for row in rows)
+        venue_ids = sorted({row['venue_id'] for row in rows})
+        artist_ids = sorted({row['artist_id'] for row in rows})
+        for show in booking_rows(connection, venue_ids, artist_ids, lower, upper):
+            self.add(show.venue_id, show.artist_id, show.start_time, show.duration, tuple(show))
+
+    def add(self, venue_id, artist_id, start_time, duration, value=None):
+        end_time = start_time + timedelta(minutes=duration)
+        value = value or (None, venue_id, artist_id, start_time, duration)
+        self.venues[venue_id].add(start_time, end_time, value)
+        self.artists[artist_id].add(start_time, end_time, value)
+
+    def conflicts(self, venue_id, artist_id, start_time, duration):
+        # form-style errors, like find_conflicts
+        end_time = start_time + timedelta(minutes=duration)
+        found = []
+        if venue_id in self.venues:
+            found.extend(self.venues[venue_id].overlapping(start_time, end_time))
+        if artist_id in self.artists:
+            found.extend(other for other in self.artists[artist_id].overlapping(start_time, end_time)
+                         if other not in found)
+        return conflict_errors(venue_id, artist_id, found)
+
+    def book(self, venue_id, artist_id, start_time, duration):
+        # adds the slot unless it conflicts; returns the errors
+        errors = self.conflicts(venue_id, artist_id, start_time, duration)
+        if not errors:
+            self.add(venue_id, artist_id, start_time, duration)
+        return errors
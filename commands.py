@@ -0,0 +1,144 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from counters import rollover_shows, recount_shows
+from deletion import pending_purges, purge
+from exporter import FORMATS, export_chunks
+from importer import Importer
+from loaders import current_time
+from models import Venue, Artist
+from page_cache import page_cache
+from partitions import add_months, archive_partitions, ensure_partitions, month_start
+from query_plans import check_plans, sample_values
+
+
+# ----------------------------------------------------------------------------#
+# CLI commands ("flask fyyur ...").
+# ----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+
+@fyyur_cli.command('rollover')
+def rollover_command():
+    """Move shows that have started from upcoming to past (run from cron)."""
+    rolled = rollover_shows()
+    click.echo(f'{rolled} shows rolled over')
+
+
+@fyyur_cli.command('recount')
+def recount_command():
+    """Rebuild the upcoming/past show flags and counters from scratch."""
+    recount_shows()
+    click.echo('show counters rebuilt')
+
+
+@fyyur_cli.command('partitions')
+@click.option('--months-ahead', type=int, help='Months of partitions to keep created ahead '
+              '(default: SHOWS_PARTITION_MONTHS_AHEAD).')
+@click.option('--retention-months', type=int, help='Archive months that ended more than this many months '
+              'ago (default: SHOWS_RETENTION_MONTHS; nothing is archived when unset).')
+@click.option('--drop', is_flag=True, help='Drop archived partitions instead of keeping them in the archive schema.')
+def partitions_command(months_ahead, retention_months, drop):
+    """Create the coming monthly shows partitions and archive old ones (run monthly from cron)."""
+    if months_ahead is None:
+        months_ahead = current_app.config.get('SHOWS_PARTITION_MONTHS_AHEAD', 12)
+    if retention_months is None:
+        retention_months = current_app.config.get('SHOWS_RETENTION_MONTHS')
+    if retention_months is not None and retention_months < 1:
+        raise click.UsageError('--retention-months must be at least 1')
+
+    cutoff = add_months(month_start(current_time()), -retention_months) if retention_months else None
+    for name in ensure_partitions(months_ahead, since=cutoff):
+        click.echo(f'created {name}')
+    if cutoff is not None:
+        for name in archive_partitions(cutoff, drop):
+            click.echo(f"{'dropped' if drop else 'archived'} {name}")
+
+
+@fyyur_cli.command('purge')
+@click.option('--batch-size', type=int, help='Shows per DELETE and commit (default: PURGE_BATCH_SIZE).')
+def purge_command(batch_size):
+    """Finish deleting venues and artists that were deleted but not purged yet."""
+    if batch_size is None:
+        batch_size = current_app.config.get('PURGE_BATCH_SIZE', 1000)
+    for model, owner_id in pending_purges():
+        shows = purge(model, owner_id, batch_size)
+        click.echo(f'purged {model.__tablename__} {owner_id} ({shows} shows)')
+
+
+@fyyur_cli.command('import')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False), help='CSV or JSONL file of venues.')
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False), help='CSV or JSONL file of artists.')
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False), help='CSV or JSONL file of shows.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per INSERT/COPY and commit.')
+@click.option('--no-copy', is_flag=True, help='Load shows with multi-row INSERTs instead of COPY.')
+def import_command(venues, artists, shows, batch_size, no_copy):
+    """Bulk-load venues, artists and shows, validated with the form rules.
+
+    Files are loaded in that order. Shows may reference the "id" column of the
+    venue/artist files or existing database ids.
+    """
+    importer = Importer(batch_size=batch_size, use_copy=not no_copy)
+    reports = []
+    if venues:
+        reports.append(importer.import_owners(Venue, venues))
+    if artists:
+        reports.append(importer.import_owners(Artist, artists))
+    if shows:
+        reports.append(importer.import_shows(shows))
+    # only reaches other workers with the shared page cache backend; elsewhere the
+    # directory indexes and facet counts pick the rows up after their TTL
+    page_cache.invalidate('venues', 'artists', 'shows')
+
+    for report in reports:
+        click.echo(f'{report.entity}: {report.inserted} rows in {report.seconds:.2f}s '
+                   f'({report.rows_per_second:.0f} rows/s), {len(report.rejected)} rejected')
+        for line, errors in report.rejected[:20]:
+            click.echo(f'  line {line}: {errors}', err=True)
+        if len(report.rejected) > 20:
+            click.echo(f'  ... {len(report.rejected) - 20} more', err=True)
+
+
+@fyyur_cli.command('export')
+@click.argument('entity', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='Output file (default: stdout).')
+@click.option('--city')
+@click.option('--state')
+@click.option('--start', type=click.DateTime(), help='Shows starting at or after this time.')
+@click.option('--end', type=click.DateTime(), help='Shows starting before this time.')
+def export_command(entity, fmt, output, city, state, start, end):
+    """Stream a table to CSV or JSONL through a server-side cursor."""
+    filters = {"city": city, "state": state}
+    if entity == 'shows':
+        filters.update(start=start, end=end)
+    elif start or end:
+        raise click.UsageError('--start/--end only apply to shows')
+    for chunk in export_chunks(entity, fmt, **filters):
+        output.write(chunk)
+
+
+@fyyur_cli.command('check-plans')
+@click.option('--allow-seqscan', is_flag=True,
+              help='Keep the planner defaults instead of disabling sequential scans.')
+@click.option('--verbose', is_flag=True, help='Print every checked statement and its plan.')
+def check_plans_command(allow_seqscan, verbose):
+    """EXPLAIN the shows queries of the hot pages; fail on sequential scans.
+
+    Run against a seeded database (see benchmarks/generate.py).
+    """
+    values = sample_values()
+    if values is None:
+        raise click.ClickException('the database has no venues, artists or shows to check with')
+    failures = 0
+    for path, statement, plan, scans in check_plans(values, allow_seqscan):
+        if scans:
+            failures += 1
+        if scans or verbose:
+            click.echo(f"{'SEQ SCAN' if scans else 'ok':8} {path}: {' '.join(statement.split())[:300]}")
+            click.echo(f"         {plan['Node Type']} (total cost {plan['Total Cost']})")
+    if failures:
+        raise click.ClickException(f'{failures} queries scan shows sequentially')
+    click.echo('no sequential scans on shows')
@@ -0,0 +1,130 @@
+from collections import Counter
+
+from sqlalchemy import bindparam, event, func, inspect, select, update
+
+from loaders import current_time
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+# Venue/Artist.upcoming_shows_count and past_shows_count are kept in step with
+# the shows table inside the same transaction as the write, so listing and
+# search pages can read them directly. Shows only move from upcoming to past
+# through rollover_shows().
+
+def apply_show_delta(connection, model, upcoming=None, past=None):
+    # upcoming/past map a venue or artist id to the change in that counter;
+    # all rows are updated with one executemany
+    upcoming = upcoming or {}
+    past = past or {}
+    table = model.__table__
+    params = [
+        {"owner_id": owner_id, "upcoming_delta": upcoming.get(owner_id, 0), "past_delta": past.get(owner_id, 0)}
+        for owner_id in set(upcoming) | set(past)
+        if upcoming.get(owner_id) or past.get(owner_id)
+    ]
+    if not params:
+        return
+    connection.execute(
+        update(table)
+        .where(table.c.id == bindparam('owner_id'))
+        .values(
+            upcoming_shows_count=func.coalesce(table.c.upcoming_shows_count, 0) + bindparam('upcoming_delta'),
+            past_shows_count=func.coalesce(table.c.past_shows_count, 0) + bindparam('past_delta')
+        ),
+        params
+    )
+
+
+def _shift(connection, venue_id, artist_id, upcoming, delta):
+    # form-submitted ids may still be strings at flush time
+    key = 'upcoming' if upcoming else 'past'
+    apply_show_delta(connection, Venue, **{key: {int(venue_id): delta}})
+    apply_show_delta(connection, Artist, **{key: {int(artist_id): delta}})
+
+
+@event.listens_for(Show, 'before_insert')
+def _show_before_insert(mapper, connection, target):
+    target.upcoming = target.start_time > current_time()
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_after_insert(mapper, connection, target):
+    _shift(connection, target.venue_id, target.artist_id, target.upcoming, 1)
+
+
+@event.listens_for(Show, 'before_delete')
+def _show_before_delete(mapper, connection, target):
+    # the in-memory flag may predate the last rollover, so read it under lock
+    row = connection.execute(
+        select(Show.__table__.c.upcoming, Show.__table__.c.venue_id, Show.__table__.c.artist_id)
+        .where(Show.__table__.c.id == target.id)
+        .with_for_update()
+    ).first()
+    if row is not None:
+        _shift(connection, row.venue_id, row.artist_id, row.upcoming, -1)
+
+
+@event.listens_for(Show, 'before_update')
+def _show_before_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[key].history.has_changes() for key in ('start_time', 'venue_id', 'artist_id')):
+        return
+    row = connection.execute(
+        select(Show.__table__.c.upcoming, Show.__table__.c.venue_id, Show.__table__.c.artist_id)
+        .where(Show.__table__.c.id == target.id)
+        .with_for_update()
+    ).first()
+    target.upcoming = target.start_time > current_time()
+    if row is not None:
+        _shift(connection, row.venue_id, row.artist_id, row.upcoming, -1)
+    _shift(connection, target.venue_id, target.artist_id, target.upcoming, 1)
+
+
+def rollover_shows(now=None):
+    # Flip shows whose start_time has passed from upcoming to past and move the
+    # matching counts, all in one transaction. Safe to run concurrently: rows
+    # already flipped by another run are not returned again.
+    if now is None:
+        now = current_time()
+
+    rolled = db.session.execute(
+        update(Show.__table__)
+        .where(Show.__table__.c.upcoming.is_(True))
+        .where(Show.__table__.c.start_time <= now)
+        .values(upcoming=False)
+        .returning(Show.__table__.c.venue_id, Show.__table__.c.artist_id)
+    ).all()
+
+    venue_counts = Counter(row.venue_id for row in rolled)
+    artist_counts = Counter(row.artist_id for row in rolled)
+    connection = db.session.connection()
+    for model, counts in ((Venue, venue_counts), (Artist, artist_counts)):
+        apply_show_delta(connection, model, upcoming={key: -n for key, n in counts.items()}, past=counts)
+    db.session.commit()
+    return len(rolled)
+
+
+def recount_shows(now=None):
+    # Rebuild every flag and counter from the shows table. Used to backfill
+    # existing data and to repair drift; rollover_shows() is the routine job.
+    if now is None:
+        now = current_time()
+
+    shows = Show.__table__
+    db.session.execute(
+        update(shows)
+        .where(shows.c.upcoming.is_distinct_from(shows.c.start_time > now))
+        .values(upcoming=shows.c.start_time > now)
+    )
+    for model, owner in ((Venue, shows.c.venue_id), (Artist, shows.c.artist_id)):
+        table = model.__table__
+        upcoming = select(func.count()).where(owner == table.c.id, shows.c.upcoming.is_(True)) \
+            .scalar_subquery()
+        past = select(func.count()).where(owner == table.c.id, shows.c.upcoming.is_(False)) \
+            .scalar_subquery()
+        db.session.execute(update(table).values(upcoming_shows_count=upcoming, past_shows_count=past))
+    db.session.commit()
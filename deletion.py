@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import Counter
+from queue import Queue
+
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from counters import apply_show_delta
+from entity_cache import entity_cache
+from loaders import current_time
+from models import db, Venue, Artist, Show
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Venue and artist deletion.
+# ----------------------------------------------------------------------------#
+
+# Deleting a venue or an artist happens in two steps. soft_delete() stamps
+# deleted_at in one UPDATE; from then on every read path leaves the row and its
+# shows out (loaders.live), so the request returns right away whatever the
+# number of shows. purge() then removes the shows with set-based
+# DELETE ... RETURNING statements of PURGE_BATCH_SIZE rows, one transaction per
+# batch, keeps the other side's show counters in step, and finally deletes the
+# row itself. The web app hands purges to purge_worker, a background thread per
+# process; `flask fyyur purge` finishes any that a restart left behind.
+
+PURGE_BATCH_SIZE = 1000
+
+# times the final DELETE of the row is retried when new shows keep turning up
+PURGE_ATTEMPTS = 5
+
+
+def _sides(model):
+    # (shows column of the deleted owner, shows column of the other side, other model)
+    shows = Show.__table__
+    if model is Venue:
+        return shows.c.venue_id, shows.c.artist_id, Artist
+    return shows.c.artist_id, shows.c.venue_id, Venue
+
+
+def _kind(model):
+    return 'venue' if model is Venue else 'artist'
+
+
+def soft_delete(model, owner_id):
+    # Hides the venue or artist and returns its name, or None if it does not
+    # exist or was already deleted. Commits.
+    table = model.__table__
+    owner_column, other_column, other = _sides(model)
+    name = db.session.execute(
+        update(table)
+        .where(table.c.id == owner_id, table.c.deleted_at.is_(None))
+        .values(deleted_at=current_time())
+        .returning(table.c.name)
+    ).scalar()
+    if name is None:
+        db.session.rollback()
+        return None
+    entity_cache.changed(db.session, model, owner_id)
+    # the other side's pages list these shows until now
+    other_ids = db.session.execute(select(other_column).where(owner_column == owner_id).distinct()).scalars().all()
+    db.session.commit()
+    page_cache.invalidate('venues', 'artists', 'shows', f'{_kind(model)}:{owner_id}',
+                          *(f'{_kind(other)}:{other_id}' for other_id in other_ids))
+    return name
+
+
+def purge(model, owner_id, batch_size=PURGE_BATCH_SIZE):
+    # Deletes the shows of a soft-deleted venue or artist batch by batch, then
+    # the row itself. Returns the number of shows deleted.
+    table = model.__table__
+    shows = Show.__table__
+    owner_column, other_column, other = _sides(model)
+    purged = 0
+    skip_locked = True
+    attempts = 0
+    while True:
+        # SKIP LOCKED lets two workers purge the same owner without waiting on
+        # each other; once it finds nothing left, the last batch waits for the
+        # rows another transaction still holds
+        batch = select(shows.c.id, shows.c.start_time) \
+            .where(owner_column == owner_id).limit(batch_size).with_for_update(skip_locked=skip_locked)
+        rows = db.session.execute(
+            delete(shows)
+            .where(tuple_(shows.c.id, shows.c.start_time).in_(batch))
+            .returning(other_column, shows.c.upcoming)
+        ).all()
+        if rows:
+            # shows deleted in bulk skip the ORM counter events
+            counts = {True: Counter(), False: Counter()}
+            for other_id, upcoming in rows:
+                counts[upcoming][other_id] -= 1
+            apply_show_delta(db.session.connection(), other, upcoming=counts[True], past=counts[False])
+            db.session.commit()
+            purged += len(rows)
+            continue
+        if skip_locked:
+            skip_locked = False
+            continue
+        try:
+            db.session.execute(delete(table).where(table.c.id == owner_id, table.c.deleted_at.is_not(None)))
+            db.session.commit()
+        except IntegrityError:
+            # a show was listed for it since the last batch; back off and go round again
+            db.session.rollback()
+            attempts += 1
+            if attempts >= PURGE_ATTEMPTS:
+                raise
+            time.sleep(0.1 * 2 ** attempts)
+            continue
+        if purged:
+            page_cache.invalidate('venues', 'artists')
+        return purged
+
+
+def pending_purges():
+    # (model, id) of every soft-deleted venue and artist still in the database
+    return [(model, owner_id) for model in (Venue, Artist)
+            for owner_id in db.session.execute(
+                select(model.__table__.c.id).where(model.__table__.c.deleted_at.is_not(None))
+            ).scalars()]
+
+
+class PurgeWorker:
+    # Runs purge() in a daemon thread, started once per process on first use
+    # (after a fork the parent's thread is gone), inside an app context of its
+    # own. Purges still queued when the process exits are left to
+    # `flask fyyur purge`.
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = PURGE_BATCH_SIZE
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('PURGE_BATCH_SIZE', PURGE_BATCH_SIZE)
+        app.extensions['purge_worker'] = self
+
+    def schedule(self, model, owner_id):
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put((model, int(owner_id)))
+
+    def join(self):
+        # blocks until everything scheduled so far has been purged
+        self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            model, owner_id = self._queue.get()
+            with self.app.app_context():
+                try:
+                    purge(model, owner_id, self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception(f'purging {_kind(model)} {owner_id} failed')
+                finally:
+                    self._queue.task_done()
+
+
+purge_worker = PurgeWorker()
@@ -0,0 +1,245 @@
+import time
+import unicodedata
+from bisect import bisect_left
+from itertools import groupby
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import select
+
+from loaders import live
+from models import db, Venue, Artist
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Index freshness.
+# ----------------------------------------------------------------------------#
+
+# The directory indexes live in each worker. Writes handled by the worker patch
+# its own copy; everything else (other workers, `flask fyyur import`) is picked
+# up by reloading: after DIRECTORY_INDEX_TTL seconds, or as soon as one of the
+# index's page cache tags has been bumped elsewhere since it was loaded, which
+# with the shared page cache backend is seen by every worker. The worker's own
+# bumps (page_cache.own_bumps) come with a patch, so they do not count. Loads
+# read the primary, so a lagging replica cannot seed an index.
+
+class Freshness:
+
+    def __init__(self, *tags):
+        self.tags = tags
+        self.versions = None
+        self.own = None
+        self.expires = 0
+
+    def _state(self):
+        # read the own bumps first, so one made in between looks like another's
+        own = page_cache.own_bumps(self.tags)
+        versions = page_cache.backend.tag_versions(self.tags) if page_cache.backend is not None else own
+        return versions, own
+
+    def loading(self):
+        # called before the load query, so a write during the load forces another
+        self.versions, self.own = self._state()
+        self.expires = time.time() + current_app.config.get('DIRECTORY_INDEX_TTL', 60)
+
+    def stale(self):
+        if time.time() >= self.expires:
+            return True
+        versions, own = self._state()
+        return any(versions[tag] - self.versions[tag] > own[tag] - self.own[tag] for tag in self.tags)
+
+
+# ----------------------------------------------------------------------------#
+# Venue directory.
+# ----------------------------------------------------------------------------#
+
+class AreaIndex:
+    # In-process map of (city, state) -> {venue_id: venue_name} backing /venues.
+    # Loaded with a single ordered query on first use and then patched by the
+    # venue write handlers, so the directory page does not touch the database.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._areas = None
+        self._venue_area = {}
+        self._snapshot = None
+        self._freshness = Freshness('venues')
+
+    def _load(self):
+        self._freshness.loading()
+        rows = db.session.execute(
+            select(Venue.city, Venue.state, Venue.id, Venue.name)
+            .where(live(Venue)).order_by(Venue.state, Venue.city, Venue.name),
+            bind_arguments={'bind': db.engine}
+        ).all()
+
+        areas = {}
+        venue_area = {}
+        for area, venues in groupby(rows, key=lambda row: (row.city, row.state)):
+            members = areas.setdefault(area, {})
+            for venue in venues:
+                members[venue.id] = venue.name
+                venue_area[venue.id] = area
+        self._areas = areas
+        self._venue_area = venue_area
+
+    def _build_snapshot(self):
+        the_data = []
+        for (city, state) in sorted(self._areas, key=lambda area: (area[1] or '', area[0] or '')):
+            members = self._areas[(city, state)]
+            the_data.append({
+                "city": city,
+                "state": state,
+                "venues": [{"id": venue_id, "name": name}
+                           for venue_id, name in sorted(members.items(), key=lambda item: (item[1] or ''))]
+            })
+        return the_data
+
+    def areas(self):
+        if self._areas is not None and self._freshness.stale():
+            self.clear()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._areas is None:
+                self._load()
+            if self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+            return self._snapshot
+
+    def put(self, venue_id, name, city, state):
+        with self._lock:
+            if self._areas is None:
+                return
+            self._discard(venue_id)
+            self._areas.setdefault((city, state), {})[venue_id] = name
+            self._venue_area[venue_id] = (city, state)
+            self._snapshot = None
+
+    def remove(self, venue_id):
+        with self._lock:
+            if self._areas is None:
+                return
+            self._discard(venue_id)
+            self._snapshot = None
+
+    def clear(self):
+        with self._lock:
+            self._areas = None
+            self._venue_area = {}
+            self._snapshot = None
+
+    def _discard(self, venue_id):
+        area = self._venue_area.pop(venue_id, None)
+        if area is None:
+            return
+        members = self._areas.get(area)
+        if members is not None:
+            members.pop(venue_id, None)
+            if not members:
+                del self._areas[area]
+
+
+area_index = AreaIndex()
+
+
+# ----------------------------------------------------------------------------#
+# Name suggestions.
+# ----------------------------------------------------------------------------#
+
+def normalize_name(name):
+    # case- and accent-insensitive, single-spaced
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+class PrefixIndex:
+    # One sorted array of (normalized key, id, name) per kind, answering prefix
+    # lookups with bisect. Every word position of a name is indexed, so "hop"
+    # finds "The Musical Hop". Writers copy the affected array and swap it in,
+    # so lookups never lock.
+
+    KINDS = (('venue', Venue), ('artist', Artist))
+
+    def __init__(self):
+        self._lock = Lock()
+        self._arrays = None
+        self._freshness = Freshness('venues', 'artists')
+
+    @staticmethod
+    def _keys_for(name):
+        words = normalize_name(name).split(' ')
+        return sorted({' '.join(words[i:]) for i in range(len(words)) if words[i]})
+
+    def _load(self):
+        self._freshness.loading()
+        arrays = {}
+        for kind, model in self.KINDS:
+            entries = []
+            rows = db.session.execute(select(model.id, model.name).where(live(model)),
+                                      bind_arguments={'bind': db.engine})
+            for row in rows:
+                entries.extend((key, row.id, row.name) for key in self._keys_for(row.name))
+            entries.sort()
+            arrays[kind] = ([entry[0] for entry in entries], entries)
+        self._arrays = arrays
+
+    def suggest(self, prefix, limit=10):
+        arrays = self._arrays
+        if arrays is not None and self._freshness.stale():
+            self.clear()
+            arrays = None
+        if arrays is None:
+            with self._lock:
+                if self._arrays is None:
+                    self._load()
+                arrays = self._arrays
+
+        prefix = normalize_name(prefix)
+        results = {kind: [] for kind, model in self.KINDS}
+        if not prefix:
+            return results
+
+        for kind, (keys, entries) in arrays.items():
+            found = results[kind]
+            seen = set()
+            position = bisect_left(keys, prefix)
+            while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+                key, owner_id, name = entries[position]
+                position += 1
+                if owner_id not in seen:
+                    seen.add(owner_id)
+                    found.append({"id": owner_id, "name": name})
+        return results
+
+    def put(self, kind, owner_id, name):
+        with self._lock:
+            if self._arrays is None:
+                return
+            keys, entries = self._without(kind, owner_id)
+            for key in self._keys_for(name):
+                position = bisect_left(keys, key)
+                keys.insert(position, key)
+                entries.insert(position, (key, owner_id, name))
+            self._arrays = dict(self._arrays, **{kind: (keys, entries)})
+
+    def remove(self, kind, owner_id):
+        with self._lock:
+            if self._arrays is None:
+                return
+            self._arrays = dict(self._arrays, **{kind: self._without(kind, owner_id)})
+
+    def clear(self):
+        with self._lock:
+            self._arrays = None
+
+    def _without(self, kind, owner_id):
+        keys, entries = self._arrays[kind]
+        kept = [entry for entry in entries if entry[1] != owner_id]
+        return [entry[0] for entry in kept], kept
+
+
+suggest_index = PrefixIndex()
@@ -0,0 +1,273 @@
+import pickle
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from flask import has_request_context
+
+from models import db, Venue, Artist
+from page_cache import InMemoryStore
+from replicas import replica_router
+
+
+# ----------------------------------------------------------------------------#
+# Venue and artist cache.
+# ----------------------------------------------------------------------------#
+
+# Read-through cache of venue and artist rows, keyed by model and id, for the
+# detail and edit pages. Entries are immutable snapshots (VenueSnapshot,
+# ArtistSnapshot) rather than ORM instances, so they can be shared between
+# requests and threads and never lazy-load. Lookups go through a bounded LRU
+# tier in each process (entries live ENTITY_CACHE_TTL seconds) and, with the
+# 'shared' backend, a store shared by all workers; rows found in neither are
+# loaded with one IN query. Counters are left out, as they change with every
+# show write.
+#
+# Changes made through the ORM are picked up at flush and dropped from both
+# tiers once the transaction commits. Core UPDATE/DELETE statements bypass the
+# flush, so their callers report the rows with changed(). Another worker's
+# local tier can keep a changed row for up to ENTITY_CACHE_TTL seconds, so
+# callers that must not see that go around it: a client pinned to the primary
+# after a write (replicas.py) always reads the row, and get() with the row
+# version the caller read (the API's ETags) bypasses a snapshot of any other
+# version.
+
+_PENDING = 'entity_cache_changed'
+
+
+@dataclass(frozen=True, slots=True)
+class VenueSnapshot:
+    id: int
+    version: int
+    name: str
+    genres: tuple
+    address: str
+    city: str
+    state: str
+    phone: str
+    website: str
+    facebook_link: str
+    seeking_talent: bool
+    seeking_description: str
+    image_link: str
+
+
+@dataclass(frozen=True, slots=True)
+class ArtistSnapshot:
+    id: int
+    version: int
+    name: str
+    genres: tuple
+    city: str
+    state: str
+    phone: str
+    website: str
+    facebook_link: str
+    seeking_venue: bool
+    seeking_description: str
+    image_link: str
+
+
+SNAPSHOTS = {Venue: VenueSnapshot, Artist: ArtistSnapshot}
+
+
+def _key(model, owner_id):
+    return f'{model.__tablename__}:{owner_id}'
+
+
+class LocalTier:
+    # In-process LRU bounded by entry count; entries expire after `ttl` seconds.
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+        return found
+
+    def set_many(self, items):
+        expires = time.time() + self.ttl
+        with self._lock:
+            for key, snapshot in items.items():
+                self._entries[key] = (snapshot, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTier:
+    # Snapshots in a store shared by all workers. `client` needs the redis-py
+    # style get/set(key, value, ex=seconds)/mget(keys)/delete(*keys); a
+    # redis.Redis instance works as is, and page_cache.InMemoryStore stands in
+    # locally.
+
+    def __init__(self, client, ttl=300, prefix='fyyur:entity:v2:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: pickle.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items):
+        for key, snapshot in items.items():
+            self.client.set(self.prefix + key, pickle.dumps(snapshot), ex=self.ttl)
+
+    def delete(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+
+class EntityCache:
+
+    def __init__(self):
+        self.enabled = True
+        self.local = LocalTier()
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._generation = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ENTITY_CACHE_ENABLED', True)
+        self.local = LocalTier(app.config.get('ENTITY_CACHE_MAX_ENTRIES', 10000),
+                               app.config.get('ENTITY_CACHE_TTL', 60))
+        if app.config.get('ENTITY_CACHE_BACKEND', 'lru') == 'shared':
+            self.shared = SharedTier(app.config.get('ENTITY_CACHE_CLIENT') or InMemoryStore(),
+                                     app.config.get('ENTITY_CACHE_SHARED_TTL', 300))
+        app.extensions['entity_cache'] = self
+
+    # reads
+
+    def get(self, model, owner_id, version=None):
+        # the snapshot of one venue or artist, None if unknown or deleted; with
+        # `version`, the row as the caller's own session reads it unless the
+        # cached snapshot has that version
+        owner_id = int(owner_id)
+        snapshot = self.get_many(model, [owner_id]).get(owner_id)
+        if version is None or snapshot is None or snapshot.version == version:
+            return snapshot
+        if snapshot.version < version:
+            self.invalidate([_key(model, owner_id)])
+        return self._load(model, [owner_id], primary=False).get(owner_id)
+
+    def get_many(self, model, ids):
+        # {id: snapshot} for the ids that exist and are not deleted
+        ids = list(dict.fromkeys(int(owner_id) for owner_id in ids))
+        if not self.enabled or (has_request_context() and replica_router.pinned()):
+            return self._load(model, ids)
+        keys = {owner_id: _key(model, owner_id) for owner_id in ids}
+        found = self.local.get_many(keys.values())
+        if self.shared is not None and len(found) < len(keys):
+            shared = self.shared.get_many(key for key in keys.values() if key not in found)
+            self.local.set_many(shared)
+            found.update(shared)
+        self.hits += len(found)
+
+        missing = [owner_id for owner_id, key in keys.items() if key not in found]
+        if missing:
+            self.misses += len(missing)
+            generation = self._generation
+            loaded = self._load(model, missing)
+            # a commit that invalidated these rows meanwhile may have been read
+            # around; the next lookup loads them again
+            if generation == self._generation:
+                loaded_keys = {keys[owner_id]: snapshot for owner_id, snapshot in loaded.items()}
+                self.local.set_many(loaded_keys)
+                if self.shared is not None:
+                    self.shared.set_many(loaded_keys)
+            found.update((keys[owner_id], snapshot) for owner_id, snapshot in loaded.items())
+        return {owner_id: found[key] for owner_id, key in keys.items() if key in found}
+
+    @staticmethod
+    def _load(model, ids, primary=True):
+        # From the primary, even in read-only views: a lagging replica could
+        # put back a row that was just invalidated. Rows that are not cached
+        # afterwards may follow the session to a replica.
+        if not ids:
+            return {}
+        snapshot = SNAPSHOTS[model]
+        table = model.__table__
+        columns = [table.c[name] for name in snapshot.__dataclass_fields__]
+        rows = db.session.execute(
+            select(*columns).where(table.c.id.in_(ids), table.c.deleted_at.is_(None)),
+            bind_arguments={'bind': db.engine} if primary else None
+        )
+        return {row.id: snapshot(**{**row._mapping, 'genres': tuple(row.genres or ())}) for row in rows}
+
+    # invalidation
+
+    def changed(self, session, model, *ids):
+        # drop these rows once `session` commits
+        session.info.setdefault(_PENDING, set()).update(_key(model, int(owner_id)) for owner_id in ids)
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+        self.local.delete(keys)
+        if self.shared is not None:
+            self.shared.delete(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+        self.local.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+entity_cache = EntityCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    for instance in list(session.dirty) + list(session.deleted):
+        if type(instance) in SNAPSHOTS:
+            entity_cache.changed(session, type(instance), instance.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    keys = session.info.pop(_PENDING, None)
+    if keys:
+        entity_cache.invalidate(keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING, None)
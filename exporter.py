@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from loaders import live
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Streaming export.
+# ----------------------------------------------------------------------------#
+
+# Rows are read through a server-side cursor (yield_per) and formatted one
+# partition at a time, so memory stays flat however large the table is.
+# Column names follow the import format (see importer.py), so an export can be
+# loaded back with `flask fyyur import`.
+
+EXPORT_BATCH_SIZE = 1000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _owner_columns(model):
+    columns = [model.id, model.name, model.city, model.state]
+    if model is Venue:
+        columns.append(model.address)
+    columns += [model.phone, model.image_link, model.genres, model.facebook_link,
+                model.website.label('website_link')]
+    columns.append(model.seeking_talent if model is Venue else model.seeking_venue)
+    columns.append(model.seeking_description)
+    return columns
+
+
+def export_query(entity, city=None, state=None, start=None, end=None):
+    # filters are applied in SQL; city/state filter shows by their venue
+    if entity in ('venues', 'artists'):
+        model = Venue if entity == 'venues' else Artist
+        query = select(*_owner_columns(model)).where(live(model))
+        if start is not None or end is not None:
+            raise ValueError('start/end only apply to shows')
+    elif entity == 'shows':
+        model = Show
+        # shows of deleted venues and artists are left out until they are purged
+        query = select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.duration) \
+            .join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id) \
+            .where(live(Venue), live(Artist))
+        if city is not None or state is not None:
+            model = Venue
+        if start is not None:
+            query = query.where(Show.start_time >= start)
+        if end is not None:
+            query = query.where(Show.start_time < end)
+    else:
+        raise ValueError(f'unknown entity {entity!r}')
+
+    if city is not None:
+        query = query.where(model.city == city)
+    if state is not None:
+        query = query.where(model.state == state)
+    order = Show.id if entity == 'shows' else model.id
+    return query.order_by(order)
+
+
+def _csv_chunk(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow([','.join(value) if isinstance(value, list) else value for value in row])
+    return buffer.getvalue()
+
+
+def _jsonl_chunk(rows, header=None):
+    return ''.join(json.dumps(row._asdict(), default=str) + '\n' for row in rows)
+
+
+def export_chunks(entity, format='csv', batch_size=EXPORT_BATCH_SIZE, **filters):
+    # yields text chunks, one per fetched partition of rows
+    formatter = _csv_chunk if format == 'csv' else _jsonl_chunk
+    result = db.session.execute(
+        export_query(entity, **filters).execution_options(yield_per=batch_size)
+    )
+    header = list(result.keys()) if format == 'csv' else None
+    try:
+        if header is not None:
+            yield formatter([], header)
+        for partition in result.partitions():
+            yield formatter(partition)
+    finally:
+        result.close()
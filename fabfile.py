@@ -1,15 +1,23 @@
+import json
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
 # prepare for deployment
 
 
+def baseline():
+    # records this machine's baseline for `fab test`
+    local("python -m benchmarks.run --output benchmarks/baseline.json")
+
+
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest -q && python -m benchmarks.run --compare benchmarks/baseline.json", capture=True
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Tests failed or benchmarks regressed. Continue?"):
         abort("Aborted at user request.")
 
 
@@ -34,22 +42,49 @@ def pull():
     local("git pull origin master")
 
 
+# the load benchmark runs against staging, never against production, and is
+# compared with a baseline recorded there and committed
+STAGING_APP = os.environ.get('HEROKU_STAGING_APP', 'fyyur-staging')
+STAGING_BASELINE = 'benchmarks/staging.json'
+
+
 def heroku():
     local("git push heroku master")
 
 
+def staging():
+    local("git push staging master")
+
+
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run --app {} --exit-code python -m benchmarks.run --requests 20 --compare {}".format(
+            STAGING_APP, STAGING_BASELINE)
+    )
+
+
+def staging_baseline():
+    # run after a deliberate performance change, then commit the file
+    report = local(
+        "heroku run --app {} --no-tty --exit-code python -m benchmarks.run --requests 20 --output -".format(STAGING_APP),
+        capture=True
     )
+    try:
+        json.loads(report)
+    except ValueError:
+        abort("The staging run did not return a benchmark report:\n{}".format(report))
+    with open(STAGING_BASELINE, 'w') as target:
+        target.write(report)
+    print("Staging baseline written to {}; commit it.".format(STAGING_BASELINE))
 
 
 def deploy():
     pull()
     test()
     commit()
-    heroku()
+    staging()
     heroku_test()
+    heroku()
 
 # rollback
 
@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import distinct, func, select, true, tuple_
+
+from loaders import directory_filters, seeking_column
+from models import db, Venue
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Browse facets.
+# ----------------------------------------------------------------------------#
+
+# Counts per genre, state, city and seeking flag for the venues or artists
+# matching the current filters, all from one GROUPING SETS query over the
+# rows joined with their unnested genres (count(DISTINCT id), so a row with
+# three genres still counts once per city). Results are cached per filter
+# signature and tagged with the page cache's "venues"/"artists" tag version,
+# so the write handlers that invalidate those pages also retire the facets.
+# With the default 'lru' page cache backend those versions are per worker, so
+# entries also expire after FACET_CACHE_TTL seconds to pick up other workers'
+# writes; with the 'shared' backend a write retires them everywhere at once.
+
+# GROUPING(genre, state, city, seeking) of each grouping set; a bit is set for
+# every column the set does not group by
+_GENRE, _CITY, _STATE, _SEEKING, _TOTAL = 0b0111, 0b1001, 0b1011, 0b1110, 0b1111
+
+
+def parse_filters(args):
+    # the browse filters present in a request's query string
+    filters = {name: args.get(name) for name in ('genre', 'city', 'state') if args.get(name)}
+    if args.get('seeking') in ('0', '1'):
+        filters['seeking'] = args.get('seeking') == '1'
+    return filters
+
+
+def filter_args(filters):
+    # filters back in query string form, for links that keep the current filters
+    return {name: ('1' if value else '0') if name == 'seeking' else value for name, value in filters.items()}
+
+
+def facet_query(model, filters):
+    genre = func.unnest(model.genres).table_valued('genre').render_derived().lateral()
+    rows = select(
+        model.id,
+        genre.c.genre,
+        model.state,
+        model.city,
+        seeking_column(model).label('seeking')
+    ).select_from(model).outerjoin(genre, true()) \
+        .where(*directory_filters(model, **filters)).subquery()
+
+    return select(
+        func.grouping(rows.c.genre, rows.c.state, rows.c.city, rows.c.seeking).label('grouping'),
+        rows.c.genre,
+        rows.c.state,
+        rows.c.city,
+        rows.c.seeking,
+        func.count(distinct(rows.c.id)).label('count')
+    ).group_by(func.grouping_sets(
+        tuple_(rows.c.genre),
+        tuple_(rows.c.state, rows.c.city),
+        tuple_(rows.c.state),
+        tuple_(rows.c.seeking),
+        tuple_()
+    ))
+
+
+def compute_facets(model, filters):
+    facets = {"total": 0, "genres": [], "states": [], "cities": [], "seeking": {True: 0, False: 0}}
+    for row in db.session.execute(facet_query(model, filters)):
+        if row.grouping == _TOTAL:
+            facets['total'] = row.count
+        elif row.grouping == _GENRE and row.genre is not None:
+            facets['genres'].append((row.genre, row.count))
+        elif row.grouping == _STATE and row.state is not None:
+            facets['states'].append((row.state, row.count))
+        elif row.grouping == _CITY and row.city is not None:
+            facets['cities'].append((row.city, row.state, row.count))
+        elif row.grouping == _SEEKING and row.seeking is not None:
+            facets['seeking'][row.seeking] = row.count
+    for name in ('genres', 'states', 'cities'):
+        facets[name].sort(key=lambda item: (-item[-1], item[:-1]))
+    return facets
+
+
+class FacetCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _tag(model):
+        return 'venues' if model is Venue else 'artists'
+
+    def get(self, model, filters):
+        tag = self._tag(model)
+        version = page_cache.backend.tag_versions([tag])[tag]
+        key = (tag, tuple(sorted(filters.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                return entry[2]
+        expires = time.time() + current_app.config.get('FACET_CACHE_TTL', 60)
+        facets = compute_facets(model, filters)
+        with self._lock:
+            self._entries[key] = (version, expires, facets)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return facets
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+facet_cache = FacetCache()
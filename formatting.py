@@ -0,0 +1,65 @@
+from datetime import datetime
+from functools import lru_cache
+
+import babel
+import babel.dates
+import dateutil.parser
+
+
+# ----------------------------------------------------------------------------#
+# Date formatting.
+# ----------------------------------------------------------------------------#
+
+# The named patterns are parsed once and the Babel locale is loaded once.
+# Formatting a value applies the compiled pattern directly, and results are
+# memoized because the same show times repeat across tiles and pages.
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+LOCALE = babel.Locale.parse('en')
+
+_compiled = {name: babel.dates.parse_pattern(pattern) for name, pattern in PATTERNS.items()}
+
+
+def _compile(format):
+    pattern = _compiled.get(format)
+    if pattern is None:
+        pattern = _compiled[format] = babel.dates.parse_pattern(format)
+    return pattern
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        # str(datetime) and isoformat() round-trip without the generic parser
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=8192)
+def _format(value, format):
+    return _compile(format).apply(to_datetime(value), LOCALE)
+
+
+def format_datetime(value, format='medium'):
+    # Jinja filter: `value` is a datetime or a date string, `format` is
+    # 'full', 'medium' or a Babel pattern
+    return _format(value, format)
+
+
+def format_datetimes(values, format='medium'):
+    # Format a page's worth of values at once; duplicates cost one lookup.
+    pattern = _compile(format)
+    results = {}
+    formatted = []
+    for value in values:
+        text = results.get(value)
+        if text is None:
+            text = results[value] = pattern.apply(to_datetime(value), LOCALE)
+        formatted.append(text)
+    return formatted
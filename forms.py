@@ -1,7 +1,10 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField, \
+    TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, Regexp, NumberRange, Optional
+
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
 
 
 
@@ -19,6 +22,25 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # minutes; imports may leave it out
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=MAX_SHOW_DURATION)],
+        default=DEFAULT_SHOW_DURATION
+    )
+
+
+
+class TourForm(FlaskForm):
+    artist_id = StringField(
+        'artist_id',
+        validators=[DataRequired()]
+    )
+    # one "venue_id, start_time[, duration]" line per show
+    shows = TextAreaField(
+        'shows',
+        validators=[DataRequired()]
+    )
 
 
 
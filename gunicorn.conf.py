@@ -0,0 +1,7 @@
+import os
+
+# Read by gunicorn in the master process before the app is loaded or any worker
+# is forked. Every worker of this server inherits the master's pid as the
+# metrics run token; a restarted server has a new one, so its first worker
+# clears the previous run's files (see metrics.py).
+os.environ['FYYUR_METRICS_RUN'] = str(os.getpid())
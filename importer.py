@@ -0,0 +1,312 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from wtforms import BooleanField, DateTimeField, IntegerField, SelectField, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import StopValidation, ValidationError
+
+from bookings import BookingIndex, lock_bookings
+from counters import apply_show_delta
+from forms import VenueForm, ArtistForm, ShowForm
+from loaders import current_time
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+
+# Rows are streamed from CSV or JSONL files and checked with the validators
+# declared on VenueForm, ArtistForm and ShowForm. The rules are read off the
+# form classes once, and each row only wraps its values in a lightweight field
+# stand-in, so no WTForms form or request context is built per row. Valid rows
+# are written in batches: batched INSERT ... RETURNING for venues and artists
+# (their ids feed the reference map used by shows), COPY for shows. Shows that
+# would double-book a venue or artist are rejected, checked in memory against
+# one query per batch (bookings.BookingIndex).
+
+# form field name -> model column, where they differ
+COLUMN_NAMES = {'website_link': 'website'}
+
+
+class _RowField:
+    # just enough of a WTForms field for validators to run against a value
+
+    def __init__(self, data, raw=None):
+        self.data = data
+        # what Optional() looks at
+        self.raw_data = [] if raw is None or raw == '' else [raw]
+        self.errors = []
+
+    @staticmethod
+    def gettext(string):
+        return string
+
+    @staticmethod
+    def ngettext(singular, plural, n):
+        return singular if n == 1 else plural
+
+
+class RowRules:
+
+    def __init__(self, form_class):
+        self.fields = []
+        for name, unbound in vars(form_class).items():
+            if not isinstance(unbound, UnboundField):
+                continue
+            choices = unbound.kwargs.get('choices')
+            self.fields.append((
+                name,
+                unbound.field_class,
+                unbound.kwargs.get('validators') or [],
+                {value for value, label in choices} if choices else None,
+                unbound.kwargs.get('format', '%Y-%m-%d %H:%M:%S')
+            ))
+
+    def clean(self, row):
+        # returns (values keyed by form field name, errors keyed the same way)
+        values = {}
+        errors = {}
+        for name, field_class, validators, choices, date_format in self.fields:
+            raw = row.get(name)
+            try:
+                value = self._coerce(field_class, raw, date_format)
+            except ValueError as error:
+                errors[name] = [str(error)]
+                continue
+
+            field = _RowField(value, raw)
+            for validator in validators:
+                try:
+                    validator(None, field)
+                except StopValidation as error:
+                    if error.args and error.args[0]:
+                        field.errors.append(error.args[0])
+                    break
+                except ValidationError as error:
+                    field.errors.append(error.args[0])
+
+            if choices is not None and value:
+                chosen = value if isinstance(value, list) else [value]
+                invalid = [item for item in chosen if item not in choices]
+                if invalid:
+                    field.errors.append(f"Not a valid choice: {', '.join(invalid)}")
+
+            if field.errors:
+                errors[name] = field.errors
+            values[name] = value
+        return values, errors
+
+    @staticmethod
+    def _coerce(field_class, raw, date_format):
+        if issubclass(field_class, BooleanField):
+            if isinstance(raw, bool):
+                return raw
+            return str(raw or '').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+        if issubclass(field_class, SelectMultipleField):
+            if raw is None or raw == '':
+                return []
+            if isinstance(raw, list):
+                return [str(item).strip() for item in raw]
+            return [item.strip() for item in str(raw).split(',') if item.strip()]
+        if issubclass(field_class, DateTimeField):
+            if raw is None or raw == '':
+                return None
+            if isinstance(raw, datetime):
+                return raw
+            try:
+                return datetime.strptime(str(raw).strip(), date_format)
+            except ValueError:
+                try:
+                    return datetime.fromisoformat(str(raw).strip())
+                except ValueError:
+                    raise ValueError('Not a valid datetime value.')
+        if issubclass(field_class, IntegerField):
+            if raw is None or raw == '':
+                return None
+            try:
+                return int(str(raw).strip())
+            except ValueError:
+                raise ValueError('Not a valid integer value.')
+        if raw is None:
+            return None
+        return str(raw).strip() if issubclass(field_class, SelectField) else str(raw)
+
+
+def read_rows(path):
+    # streams dict rows from a .csv or .jsonl file, with their line numbers
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            for number, line in enumerate(source, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+        else:
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportReport:
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.inserted = 0
+        self.rejected = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+
+class Importer:
+
+    def __init__(self, batch_size=1000, use_copy=True):
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.rules = {Venue: RowRules(VenueForm), Artist: RowRules(ArtistForm), Show: RowRules(ShowForm)}
+        # external id from the import files -> database id
+        self.id_map = {Venue: {}, Artist: {}}
+        self._known_ids = {}
+
+    def _owner_values(self, model, values):
+        row = {COLUMN_NAMES.get(name, name): value for name, value in values.items()}
+        row.pop('csrf_token', None)
+        return {key: value for key, value in row.items() if key in model.__table__.c}
+
+    def import_owners(self, model, path):
+        # venues or artists; ids in the file are kept only as keys of id_map
+        report = ImportReport(model.__tablename__)
+        rules = self.rules[model]
+        table = model.__table__
+
+        def valid_rows():
+            for line, row in read_rows(path):
+                values, errors = rules.clean(row)
+                if errors:
+                    report.rejected.append((line, errors))
+                    continue
+                yield row.get('id'), self._owner_values(model, values)
+
+        for batch in _batches(valid_rows(), self.batch_size):
+            # "insertmanyvalues" executemany; ids come back in parameter order
+            ids = db.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                [values for external_id, values in batch]
+            ).scalars().all()
+            for (external_id, values), new_id in zip(batch, ids):
+                if external_id not in (None, ''):
+                    self.id_map[model][str(external_id)] = new_id
+            db.session.commit()
+            report.inserted += len(batch)
+        return report.finish()
+
+    def _resolve(self, model, reference):
+        reference = str(reference).strip()
+        if reference in self.id_map[model]:
+            return self.id_map[model][reference]
+        if model not in self._known_ids:
+            self._known_ids[model] = set(db.session.execute(
+                select(model.__table__.c.id).where(model.__table__.c.deleted_at.is_(None))).scalars())
+        if reference.isdigit() and int(reference) in self._known_ids[model]:
+            return int(reference)
+        return None
+
+    def import_shows(self, path):
+        report = ImportReport('shows')
+        rules = self.rules[Show]
+        now = current_time()
+
+        def valid_rows():
+            for line, row in read_rows(path):
+                values, errors = rules.clean(row)
+                if not errors:
+                    venue_id = self._resolve(Venue, values['venue_id'])
+                    artist_id = self._resolve(Artist, values['artist_id'])
+                    if venue_id is None:
+                        errors['venue_id'] = ['Unknown venue.']
+                    if artist_id is None:
+                        errors['artist_id'] = ['Unknown artist.']
+                if errors:
+                    report.rejected.append((line, errors))
+                    continue
+                start_time = values['start_time']
+                yield line, {"venue_id": venue_id, "artist_id": artist_id, "start_time": start_time,
+                             "duration": values['duration'] or DEFAULT_SHOW_DURATION, "upcoming": start_time > now}
+
+        for batch in _batches(valid_rows(), self.batch_size):
+            connection = db.session.connection()
+            # the batch's venues and artists stay locked until its commit, and
+            # its rows are checked against their bookings in memory
+            rows = [row for line, row in batch]
+            lock_bookings(connection, {row['venue_id'] for row in rows}, {row['artist_id'] for row in rows})
+            bookings = BookingIndex()
+            bookings.load(connection, rows)
+            accepted = []
+            for line, row in batch:
+                errors = bookings.book(row['venue_id'], row['artist_id'], row['start_time'], row['duration'])
+                if errors:
+                    report.rejected.append((line, errors))
+                else:
+                    accepted.append(row)
+            if not accepted:
+                db.session.rollback()
+                continue
+
+            if not (self.use_copy and _copy_shows(connection, accepted)):
+                connection.execute(insert(Show.__table__), accepted)
+            # counters are normally kept by ORM events; bulk rows update them once per batch
+            for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+                upcoming = Counter(row[key] for row in accepted if row['upcoming'])
+                past = Counter(row[key] for row in accepted if not row['upcoming'])
+                apply_show_delta(connection, model, upcoming=upcoming, past=past)
+            db.session.commit()
+            report.inserted += len(accepted)
+        return report.finish()
+
+
+def _copy_shows(connection, rows):
+    # COPY through the DBAPI cursor; returns False when the driver has no COPY support
+    columns = ('venue_id', 'artist_id', 'start_time', 'duration', 'upcoming')
+    statement = f"COPY shows ({', '.join(columns)}) FROM STDIN"
+    raw = connection.connection
+    cursor = raw.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            # psycopg2
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow([row[column] for column in columns])
+            buffer.seek(0)
+            cursor.copy_expert(statement + ' WITH (FORMAT csv)', buffer)
+            return True
+        if hasattr(cursor, 'copy'):
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in columns])
+            return True
+        return False
+    finally:
+        cursor.close()
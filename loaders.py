@@ -0,0 +1,272 @@
+from datetime import datetime, timezone
+from itertools import groupby
+
+from sqlalchemy import cast, false, select, true, tuple_, union_all
+
+from entity_cache import entity_cache
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Show loaders.
+# ----------------------------------------------------------------------------#
+
+def current_time():
+    # One timezone-aware "now" per request. start_time is stored as naive local
+    # wall-clock time, so it is compared against the same instant in local time.
+    return datetime.now(timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def live(model):
+    # deleted venues and artists stay hidden until deletion.py purges them
+    return model.deleted_at.is_(None)
+
+
+def _owner_shows(owner_column, owner_id, columns, joined, now):
+    # One owner's shows as UNION ALL of an upcoming and a past branch. Each
+    # branch is bounded on start_time, so the planner prunes the partitions it
+    # cannot match: upcoming rows are only looked up in the current and later
+    # months. The database still evaluates the past/upcoming split.
+    def branch(condition, upcoming):
+        return select(*columns, Show.start_time, (true() if upcoming else false()).label('is_upcoming')) \
+            .join_from(Show, joined) \
+            .where(owner_column == owner_id, condition, live(joined))
+
+    shows = union_all(branch(Show.start_time > now, True), branch(Show.start_time <= now, False)).subquery()
+    return db.session.execute(select(shows).order_by(shows.c.start_time)).all()
+
+
+def venue_shows(venue_id, now=None):
+    # All shows at a venue with the artist columns the page needs, in a single
+    # query.
+    if now is None:
+        now = current_time()
+
+    rows = _owner_shows(Show.venue_id, venue_id, (Show.artist_id, Artist.name, Artist.image_link), Artist, now)
+
+    upcoming_shows = []
+    past_shows = []
+    for row in rows:
+        details = {
+            "artist_id": row.artist_id,
+            "artist_name": row.name,
+            "artist_image_link": row.image_link,
+            "start_time": str(row.start_time)
+        }
+        if row.is_upcoming:
+            upcoming_shows.append(details)
+        else:
+            past_shows.append(details)
+    return upcoming_shows, past_shows
+
+
+def artist_shows(artist_id, now=None):
+    # All shows for an artist with the venue columns the page needs, in a single
+    # query.
+    if now is None:
+        now = current_time()
+
+    rows = _owner_shows(Show.artist_id, artist_id, (Show.venue_id, Venue.name, Venue.image_link), Venue, now)
+
+    upcoming_shows = []
+    past_shows = []
+    for row in rows:
+        details = {
+            "venue_id": row.venue_id,
+            "venue_name": row.name,
+            "venue_image_link": row.image_link,
+            "start_time": str(row.start_time)
+        }
+        if row.is_upcoming:
+            upcoming_shows.append(details)
+        else:
+            past_shows.append(details)
+    return upcoming_shows, past_shows
+
+
+def venue_detail(venue_id, now=None, version=None):
+    # Everything the venue page shows, or None for an unknown venue. `version`
+    # is the row version the caller already read (see EntityCache.get).
+    the_venue = entity_cache.get(Venue, venue_id, version)
+    if the_venue is None:
+        return None
+
+    upcoming_shows, past_shows = venue_shows(venue_id, now)
+
+    return {
+        "id": the_venue.id,
+        "name": the_venue.name,
+        "genres": list(the_venue.genres),
+        "address": the_venue.address,
+        "city": the_venue.city,
+        "state": the_venue.state,
+        "phone": the_venue.phone,
+        "website": the_venue.website,
+        "facebook_link": the_venue.facebook_link,
+        "seeking_talent": the_venue.seeking_talent,
+        "seeking_description": the_venue.seeking_description,
+        "image_link": the_venue.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+
+def artist_detail(artist_id, now=None, version=None):
+    # Everything the artist page shows, or None for an unknown artist. `version`
+    # is the row version the caller already read (see EntityCache.get).
+    artist = entity_cache.get(Artist, artist_id, version)
+    if artist is None:
+        return None
+
+    upcoming_shows, past_shows = artist_shows(artist_id, now)
+
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": list(artist.genres),
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+
+def _has_genre(genres, genre):
+    # array containment (genres @> ARRAY[genre]), which the GIN indexes on genres answer
+    return genres.op('@>')(cast([genre], genres.type))
+
+
+def seeking_column(model):
+    return model.seeking_talent if model is Venue else model.seeking_venue
+
+
+def directory_filters(model, genre=None, city=None, state=None, seeking=None):
+    # WHERE conditions for the /venues and /artists browse filters
+    conditions = [live(model)]
+    if genre:
+        conditions.append(_has_genre(model.genres, genre))
+    if city:
+        conditions.append(model.city == city)
+    if state:
+        conditions.append(model.state == state)
+    if seeking is not None:
+        conditions.append(seeking_column(model).is_(seeking))
+    return conditions
+
+
+def artist_directory(**filters):
+    rows = Artist.query.with_entities(Artist.id, Artist.name) \
+        .filter(*directory_filters(Artist, **filters)).order_by(Artist.name).all()
+    return [{"id": row.id, "name": row.name} for row in rows]
+
+
+def venue_directory(**filters):
+    # filtered /venues: the same (city, state) grouping as directory.AreaIndex
+    rows = Venue.query.with_entities(Venue.city, Venue.state, Venue.id, Venue.name) \
+        .filter(*directory_filters(Venue, **filters)) \
+        .order_by(Venue.state, Venue.city, Venue.name).all()
+    return [
+        {"city": city, "state": state, "venues": [{"id": row.id, "name": row.name} for row in venues]}
+        for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city))
+    ]
+
+
+def show_detail(show_id):
+    row = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.venue_id,
+        Venue.name.label('venue_name')
+    ).join(Artist, Show.artist_id == Artist.id) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .filter(Show.id == show_id, live(Artist), live(Venue)).first()
+    if row is None:
+        return None
+    return {
+        "id": row.id,
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": str(row.start_time)
+    }
+
+
+def _parse_cursor(cursor):
+    # "<iso start_time>_<show id>", as produced by _make_cursor
+    try:
+        start_time, show_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _make_cursor(start_time, show_id):
+    return f'{start_time.isoformat()}_{show_id}'
+
+
+def _shows_window(columns, after=None, upcoming_only=False, start=None, end=None, limit=30, now=None):
+    # the filtered shows listing from the keyset position on, one row past the page
+    shows = db.session.query(*columns) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .filter(live(Artist), live(Venue))
+
+    if upcoming_only:
+        shows = shows.filter(Show.start_time > (now or current_time()))
+    if start is not None:
+        shows = shows.filter(Show.start_time >= start)
+    if end is not None:
+        shows = shows.filter(Show.start_time < end)
+    position = _parse_cursor(after) if after else None
+    if position is not None:
+        shows = shows.filter(tuple_(Show.start_time, Show.id) > tuple_(*position))
+    return shows.order_by(Show.start_time, Show.id).limit(limit + 1)
+
+
+def shows_page(after=None, upcoming_only=False, start=None, end=None, limit=30, now=None):
+    # One page of the shows listing, keyset-paginated on (start_time, id) and
+    # joined to the artist and venue columns the tiles need. Returns the page
+    # and the cursor for the next one (None on the last page).
+    rows = _shows_window(
+        (Show.id, Show.start_time, Show.artist_id, Artist.name.label('artist_name'),
+         Artist.image_link.label('artist_image_link'), Show.venue_id, Venue.name.label('venue_name')),
+        after, upcoming_only, start, end, limit, now
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _make_cursor(rows[-1].start_time, rows[-1].id)
+
+    data = []
+    for row in rows:
+        data.append({
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": str(row.start_time)
+        })
+    return data, next_cursor
+
+
+def shows_page_stamp(after=None, upcoming_only=False, start=None, end=None, limit=30, now=None):
+    # ids and row versions of exactly the rows behind a shows page, for its ETag
+    rows = _shows_window((Show.id, Show.version, Venue.version, Artist.version),
+                         after, upcoming_only, start, end, limit, now).all()
+    return tuple(tuple(row) for row in rows)
@@ -0,0 +1,376 @@
+import atexit
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import Response, g, request, before_render_template, template_rendered
+
+
+# ----------------------------------------------------------------------------#
+# Prometheus metrics.
+# ----------------------------------------------------------------------------#
+
+# Request handlers only append (kind, name, labels, value) events to a deque,
+# which is thread-safe without a lock. A background thread in each worker
+# process drains the deque into that process's own memory-mapped file in
+# METRICS_DIR, so every file has a single writer. /metrics sums the files of
+# all workers. Values therefore lag by up to METRICS_FLUSH_INTERVAL seconds.
+#
+# Only server workers record anything: the server's master process sets
+# METRICS_RUN (FYYUR_METRICS_RUN, see gunicorn.conf.py) to a token of its own,
+# which its workers inherit. CLI commands, cron jobs, benchmarks and tests run
+# without it and leave METRICS_DIR alone.
+#
+# Files outlive their process. The first worker of a new run removes every file
+# left over from the previous one; within a run, a starting worker folds the
+# counters and histograms of dead workers into metrics_archive.db, so totals do
+# not drop when a worker is replaced (prometheus_client's mark_process_dead does
+# the same for its live gauges).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HEADER = struct.Struct('<I4x')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+_ARCHIVE = 'metrics_archive.db'
+_RUN = 'metrics.run'
+
+
+def _entries(data, used):
+    # yields (key, value, value offset) from a value file's bytes
+    offset = _HEADER.size
+    while offset < used:
+        length, = _LENGTH.unpack_from(data, offset)
+        key_end = offset + _LENGTH.size + length
+        value_offset = key_end + (-key_end % 8)
+        yield data[offset + _LENGTH.size:key_end].decode(), _VALUE.unpack_from(data, value_offset)[0], value_offset
+        offset = value_offset + _VALUE.size
+
+
+class ValueFile:
+    # One process's values: an 8 byte header holding the bytes in use, then
+    # entries of uint32 key length, utf-8 key padded to 8 bytes and a float64.
+
+    def __init__(self, path, initial_size=64 * 1024):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(initial_size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        # a reused pid continues its predecessor's file
+        self.offsets = {key: offset for key, value, offset in _entries(self._map, self.used)}
+
+    def add(self, key, amount):
+        offset = self._offset(key)
+        _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def set(self, key, value):
+        _VALUE.pack_into(self._map, self._offset(key), value)
+
+    def _offset(self, key):
+        offset = self.offsets.get(key)
+        if offset is not None:
+            return offset
+        encoded = key.encode()
+        key_end = self.used + _LENGTH.size + len(encoded)
+        offset = key_end + (-key_end % 8)
+        if offset + _VALUE.size > len(self._map):
+            self._grow(offset + _VALUE.size)
+        _LENGTH.pack_into(self._map, self.used, len(encoded))
+        self._map[self.used + _LENGTH.size:key_end] = encoded
+        _VALUE.pack_into(self._map, offset, 0.0)
+        # the header is written last, so readers never see a partial entry
+        self.used = offset + _VALUE.size
+        _HEADER.pack_into(self._map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    @staticmethod
+    def read(path):
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < _HEADER.size:
+            return []
+        return [(key, value) for key, value, offset in _entries(data, _HEADER.unpack_from(data, 0)[0])]
+
+
+def _pid(path):
+    # the worker pid in a value file name, None for the archive
+    name = os.path.basename(path)[len('metrics_'):-len('.db')]
+    return int(name) if name.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class Metrics:
+
+    def __init__(self):
+        self.enabled = True
+        self.run = None
+        self.directory = os.path.join(tempfile.gettempdir(), 'fyyur-metrics')
+        self.flush_interval = 1.0
+        self.families = {}
+        self._collectors = []
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+
+        self.counter('fyyur_http_requests_total', 'HTTP requests by endpoint, method and status.')
+        self.histogram('fyyur_http_request_duration_seconds', 'Request latency by endpoint and status.')
+        self.histogram('fyyur_template_render_seconds', 'Jinja template render time by template.')
+        self.counter('fyyur_db_pool_checkouts_total', 'Connections checked out of the pool.')
+        self.histogram('fyyur_db_pool_wait_seconds', 'Time spent waiting for a pooled connection.',
+                       (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+        self.counter('fyyur_page_cache_hits_total', 'Rendered page cache hits.')
+        self.counter('fyyur_page_cache_misses_total', 'Rendered page cache misses.')
+        self.counter('fyyur_page_cache_bypasses_total', 'Requests that skipped the page cache.')
+        self.counter('fyyur_page_cache_invalidations_total', 'Page cache tag invalidations.')
+        self.gauge('fyyur_page_cache_hit_ratio', 'Page cache hits / lookups across all workers.')
+
+    # declarations
+
+    def counter(self, name, help):
+        self.families[name] = ('counter', help, None)
+
+    def gauge(self, name, help):
+        self.families[name] = ('gauge', help, None)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.families[name] = ('histogram', help, tuple(buckets))
+
+    def collector(self, function):
+        # `function()` returns [(name, labels dict, value)] of absolute per-process
+        # values; it is called on every flush
+        self._collectors.append(function)
+        return function
+
+    # recording, called on the request path
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        self._events.append(('inc', name, tuple(sorted(labels.items())), amount))
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        self._events.append(('observe', name, tuple(sorted(labels.items())), value))
+
+    # flushing, in the background thread
+
+    def _start(self):
+        # once per process; after a fork the parent's thread and file are gone
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # workers starting together take turns, so exactly one sees a restart
+            with open(os.path.join(self.directory, _RUN), 'a+') as run:
+                fcntl.flock(run, fcntl.LOCK_EX)
+                self._clean_up(run)
+                self._file = ValueFile(os.path.join(self.directory, f'metrics_{os.getpid()}.db'))
+            self._events.clear()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, daemon=True).start()
+            atexit.register(self.flush)
+
+    def _clean_up(self, run):
+        paths = glob.glob(os.path.join(self.directory, 'metrics_*.db'))
+        run.seek(0)
+        if run.read() != self.run:
+            # the server was restarted; this includes a file left by a process with this pid
+            for path in paths:
+                os.remove(path)
+            run.truncate(0)
+            run.write(self.run)
+            return
+        dead = [path for path in paths if _pid(path) not in (None, os.getpid()) and not _alive(_pid(path))]
+        if not dead:
+            return
+        archive = ValueFile(os.path.join(self.directory, _ARCHIVE))
+        for path in dead:
+            for key, value in ValueFile.read(path):
+                if self.families.get(json.loads(key)[0], ('counter',))[0] != 'gauge':
+                    archive.add(key, value)
+            os.remove(path)
+        archive.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        if self._file is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            while self._events:
+                kind, name, labels, value = self._events.popleft()
+                if kind == 'inc':
+                    self._file.add(self._key(name, '', labels), value)
+                    continue
+                for bound in self.families[name][2]:
+                    if value <= bound:
+                        self._file.add(self._key(name, '_bucket', labels + (('le', repr(bound)),)), 1)
+                self._file.add(self._key(name, '_bucket', labels + (('le', '+Inf'),)), 1)
+                self._file.add(self._key(name, '_sum', labels), value)
+                self._file.add(self._key(name, '_count', labels), 1)
+            for collect in self._collectors:
+                for name, labels, value in collect():
+                    self._file.set(self._key(name, '', tuple(sorted(labels.items()))), value)
+
+    @staticmethod
+    def _key(name, suffix, labels):
+        return json.dumps([name, suffix, labels])
+
+    # exposition
+
+    def collect(self):
+        # {(family, suffix, labels): value} summed over every worker's file
+        self.flush()
+        totals = defaultdict(float)
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            for key, value in ValueFile.read(path):
+                name, suffix, labels = json.loads(key)
+                totals[name, suffix, tuple(tuple(label) for label in labels)] += value
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        lookups = sum(value for (name, suffix, labels), value in totals.items()
+                      if name in ('fyyur_page_cache_hits_total', 'fyyur_page_cache_misses_total'))
+        if lookups:
+            hits = totals.get(('fyyur_page_cache_hits_total', '', ()), 0.0)
+            totals['fyyur_page_cache_hit_ratio', '', ()] = hits / lookups
+
+        samples = defaultdict(list)
+        for (name, suffix, labels), value in totals.items():
+            samples[name].append((suffix, labels, value))
+        lines = []
+        for name, (kind, help, buckets) in self.families.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in sorted(samples.get(name, []), key=self._sample_order):
+                lines.append(f'{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _sample_order(sample):
+        # series together, buckets in increasing order with +Inf last
+        suffix, labels, value = sample
+        series = [label for label in labels if label[0] != 'le']
+        bound = dict(labels).get('le')
+        return series, suffix != '_bucket', float(bound) if bound else 0.0
+
+    # Flask integration
+
+    def init_app(self, app, engine=None):
+        self.run = app.config.get('METRICS_RUN')
+        self.enabled = bool(app.config.get('METRICS_ENABLED', True) and self.run)
+        if not self.enabled:
+            return
+        self.directory = app.config.get('METRICS_DIR') or self.directory
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+
+        app.before_request(self._request_started)
+        app.after_request(self._request_finished)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        if engine is not None:
+            self.instrument_engine(engine)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.extensions['metrics'] = self
+
+    def instrument_engine(self, engine, pool='primary'):
+        # times every connection checkout, including the wait for a free slot
+        if not self.enabled:
+            return
+        raw_connection = engine.raw_connection
+
+        def timed_raw_connection(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return raw_connection(*args, **kwargs)
+            finally:
+                self.observe('fyyur_db_pool_wait_seconds', time.perf_counter() - started, pool=pool)
+                self.inc('fyyur_db_pool_checkouts_total', pool=pool)
+
+        engine.raw_connection = timed_raw_connection
+
+    @staticmethod
+    def _request_started():
+        g.metrics_started = time.perf_counter()
+
+    def _request_finished(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'none'
+            status = str(response.status_code)
+            self.inc('fyyur_http_requests_total', endpoint=endpoint, method=request.method, status=status)
+            self.observe('fyyur_http_request_duration_seconds', time.perf_counter() - started,
+                         endpoint=endpoint, status=status)
+        return response
+
+    @staticmethod
+    def _render_started(sender, template, context, **extra):
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def _render_finished(self, sender, template, context, **extra):
+        renders = g.get('metrics_renders')
+        if renders:
+            self.observe('fyyur_template_render_seconds', time.perf_counter() - renders.pop(),
+                         template=template.name or 'string')
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
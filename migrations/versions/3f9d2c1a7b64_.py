@@ -0,0 +1,40 @@
+"""trigram search indexes on venue and artist
+
+Revision ID: 3f9d2c1a7b64
+Revises: b0bb8431a4f7
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d2c1a7b64'
+down_revision = 'b0bb8431a4f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string is only STABLE, so the searchable text is wrapped in an
+    # IMMUTABLE function that can back an expression index (see search.py)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION fyyur_search_text(name text, city text, genres varchar[])
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+            SELECT lower(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' ||
+                         coalesce(array_to_string(genres, ' '), ''))
+        $$
+    """)
+    op.execute('CREATE INDEX ix_venue_search_trgm ON venue '
+               'USING gin (fyyur_search_text(name, city, genres) gin_trgm_ops)')
+    op.execute('CREATE INDEX ix_artist_search_trgm ON artist '
+               'USING gin (fyyur_search_text(name, city, genres) gin_trgm_ops)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_artist_search_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_venue_search_trgm')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_search_text(text, text, varchar[])')
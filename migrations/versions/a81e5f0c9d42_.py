@@ -0,0 +1,28 @@
+"""row version columns for ETags
+
+Revision ID: a81e5f0c9d42
+Revises: 3f9d2c1a7b64
+Create Date: 2026-10-18 11:40:05.218664
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81e5f0c9d42'
+down_revision = '3f9d2c1a7b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('shows', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('shows', 'version')
+    op.drop_column('artist', 'version')
+    op.drop_column('venue', 'version')
@@ -0,0 +1,67 @@
+"""add show durations and exclusion constraints against double bookings
+
+Revision ID: b7e4d1f6a283
+Revises: f3c81d2a9e47
+Create Date: 2026-10-18 19:02:51.337640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d1f6a283'
+down_revision = 'f3c81d2a9e47'
+branch_labels = None
+depends_on = None
+
+DEFAULT_DURATION = 120
+BOOKED_RANGE = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+# Shows listed before durations existed get the default, cut short where the
+# next show at the same venue or of the same artist starts earlier, so the
+# constraints can be added to existing data. A double booking at the very same
+# start time leaves the earlier row with a zero duration (an empty range).
+TRIM = f"""
+    UPDATE shows SET duration = trimmed.duration
+    FROM (
+        SELECT id, start_time, least(
+            {DEFAULT_DURATION},
+            floor(extract(epoch FROM lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id)
+                                     - start_time) / 60),
+            floor(extract(epoch FROM lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id)
+                                     - start_time) / 60)
+        ) AS duration
+        FROM shows
+    ) AS trimmed
+    WHERE shows.id = trimmed.id AND shows.start_time = trimmed.start_time
+      AND trimmed.duration < {DEFAULT_DURATION}
+"""
+
+
+def _partitions():
+    return op.get_bind().execute(sa.text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'shows'::regclass ORDER BY child.relname"
+    )).scalars().all()
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('shows', sa.Column('duration', sa.Integer(), server_default=str(DEFAULT_DURATION),
+                                     nullable=False))
+    op.execute(TRIM)
+    op.create_check_constraint('ck_shows_duration', 'shows', 'duration >= 0 AND duration <= 1440')
+    # exclusion constraints are not supported on the partitioned parent
+    for name in _partitions():
+        for owner in ('venue', 'artist'):
+            op.execute(f'ALTER TABLE {name} ADD CONSTRAINT {name}_{owner}_booking '
+                       f'EXCLUDE USING gist ({owner}_id WITH =, {BOOKED_RANGE} WITH &&)')
+
+
+def downgrade():
+    for name in _partitions():
+        for owner in ('venue', 'artist'):
+            op.execute(f'ALTER TABLE {name} DROP CONSTRAINT {name}_{owner}_booking')
+    op.drop_constraint('ck_shows_duration', 'shows', type_='check')
+    op.drop_column('shows', 'duration')
@@ -0,0 +1,29 @@
+"""add deleted_at to venue and artist for soft deletion
+
+Revision ID: c9a4f2e7d318
+Revises: b7e4d1f6a283
+Create Date: 2026-10-18 20:14:07.512893
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a4f2e7d318'
+down_revision = 'b7e4d1f6a283'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        op.create_index(f'ix_{table}_deleted_at', table, ['deleted_at'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index(f'ix_{table}_deleted_at', table_name=table)
+        op.drop_column(table, 'deleted_at')
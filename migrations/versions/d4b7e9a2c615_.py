@@ -0,0 +1,66 @@
+"""normalize genre arrays and add GIN indexes for genre filters
+
+Revision ID: d4b7e9a2c615
+Revises: a81e5f0c9d42
+Create Date: 2026-10-18 14:05:47.731920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7e9a2c615'
+down_revision = 'a81e5f0c9d42'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+# Rows written before genres became arrays (85711045824c stored a String)
+# can hold several comma-joined genres in one element, or stray braces and
+# quotes from the conversion. Each element is split on commas and trimmed,
+# blanks and duplicates are dropped, and the original order is kept.
+NORMALIZE = """
+    UPDATE {table} SET genres = normalized.genres
+    FROM (
+        SELECT id, coalesce(array_agg(genre ORDER BY position) FILTER (WHERE genre <> ''),
+                            '{{}}')::varchar[] AS genres
+        FROM (
+            SELECT owner.id, btrim(part.value, ' {{}}"') AS genre,
+                   min(element.number * 1000 + part.number) AS position
+            FROM {table} AS owner
+            CROSS JOIN LATERAL unnest(owner.genres) WITH ORDINALITY AS element(value, number)
+            CROSS JOIN LATERAL unnest(string_to_array(element.value, ',')) WITH ORDINALITY AS part(value, number)
+            WHERE owner.id > :start AND owner.id <= :stop
+            GROUP BY owner.id, btrim(part.value, ' {{}}"')
+        ) AS parts
+        GROUP BY id
+    ) AS normalized
+    WHERE {table}.id = normalized.id AND {table}.genres IS DISTINCT FROM normalized.genres
+"""
+
+
+def _normalize(connection, table):
+    # one short transaction per id range, so large tables are not locked as a whole
+    last_id = connection.execute(sa.text(f'SELECT coalesce(max(id), 0) FROM {table}')).scalar()
+    statement = sa.text(NORMALIZE.format(table=table))
+    for start in range(0, last_id, BATCH_SIZE):
+        connection.execute(statement, {"start": start, "stop": start + BATCH_SIZE})
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for table in ('venue', 'artist'):
+            _normalize(connection, table)
+        op.create_index('ix_venue_genres', 'venue', ['genres'], postgresql_using='gin',
+                        postgresql_concurrently=True)
+        op.create_index('ix_artist_genres', 'artist', ['genres'], postgresql_using='gin',
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artist_genres', table_name='artist', postgresql_concurrently=True)
+        op.drop_index('ix_venue_genres', table_name='venue', postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""index shows for the detail pages, /shows keyset pages and rollover
+
+Revision ID: e1a9c3f7b250
+Revises: d4b7e9a2c615
+Create Date: 2026-10-18 16:12:08.415302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a9c3f7b250'
+down_revision = 'd4b7e9a2c615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built concurrently, so shows stays writable while they are created
+    with op.get_context().autocommit_block():
+        op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_shows_upcoming_start_time', 'shows', ['start_time'],
+                        postgresql_where=sa.text('upcoming'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shows_upcoming_start_time', table_name='shows', postgresql_concurrently=True)
+        op.drop_index('ix_shows_start_time_id', table_name='shows', postgresql_concurrently=True)
+        op.drop_index('ix_shows_artist_id_start_time', table_name='shows', postgresql_concurrently=True)
+        op.drop_index('ix_shows_venue_id_start_time', table_name='shows', postgresql_concurrently=True)
@@ -0,0 +1,94 @@
+"""partition shows by month of start_time
+
+Revision ID: f3c81d2a9e47
+Revises: e1a9c3f7b250
+Create Date: 2026-10-18 17:40:22.905113
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c81d2a9e47'
+down_revision = 'e1a9c3f7b250'
+branch_labels = None
+depends_on = None
+
+# months of partitions created past the current one; `flask fyyur partitions`
+# keeps extending them from here
+MONTHS_AHEAD = 12
+
+# The rows are copied into a new partitioned table, which then takes over the
+# name, the id sequence and the indexes. shows is locked against writes for
+# the duration (reads keep working until the final swap), so run this in a
+# quiet period on a large table.
+
+INDEXES = (
+    ('ix_shows_venue_id_start_time', ['venue_id', 'start_time'], {}),
+    ('ix_shows_artist_id_start_time', ['artist_id', 'start_time'], {}),
+    ('ix_shows_start_time_id', ['start_time', 'id'], {}),
+    ('ix_shows_upcoming_start_time', ['start_time'], {"postgresql_where": sa.text('upcoming')}),
+)
+
+COLUMNS = 'id, upcoming, start_time, venue_id, artist_id, version'
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('shows_id_seq'::regclass)"),
+                  nullable=False),
+        sa.Column('upcoming', sa.Boolean(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], name='shows_venue_id_fkey'),
+        sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], name='shows_artist_id_fkey'),
+    ]
+
+
+def _swap(new_table):
+    # new_table replaces shows: same sequence, name, primary key and indexes
+    op.execute(f'INSERT INTO {new_table} ({COLUMNS}) SELECT {COLUMNS} FROM shows')
+    op.execute(f'ALTER SEQUENCE shows_id_seq OWNED BY {new_table}.id')
+    op.drop_table('shows')
+    op.rename_table(new_table, 'shows')
+
+
+def upgrade():
+    op.execute('LOCK TABLE shows IN EXCLUSIVE MODE')
+    op.create_table('shows_partitioned', *_columns(), postgresql_partition_by='RANGE (start_time)')
+
+    first = op.get_bind().execute(sa.text("SELECT date_trunc('month', min(start_time)) FROM shows")).scalar()
+    current = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month = min(first or current, current)
+    while month <= _add_months(current, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(f"CREATE TABLE shows_p{month:%Y_%m} PARTITION OF shows_partitioned "
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')")
+        month = upper
+    op.execute('CREATE TABLE shows_default PARTITION OF shows_partitioned DEFAULT')
+
+    _swap('shows_partitioned')
+    # created on the parent after the copy; each partition gets its own index
+    op.create_primary_key('shows_pkey', 'shows', ['id', 'start_time'])
+    for name, columns, options in INDEXES:
+        op.create_index(name, 'shows', columns, **options)
+
+
+def downgrade():
+    # detached (archived) partitions are not copied back
+    op.execute('LOCK TABLE shows IN EXCLUSIVE MODE')
+    op.create_table('shows_plain', *_columns())
+    _swap('shows_plain')
+    op.create_primary_key('shows_pkey', 'shows', ['id'])
+    for name, columns, options in INDEXES:
+        op.create_index(name, 'shows', columns, **options)
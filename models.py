@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
+from replicas import RoutingSession
+
 # TODO: connect to a local postgresql database
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 def db_setup(app):
@@ -17,8 +19,26 @@ def db_setup(app):
 # Models.
 # ----------------------------------------------------------------------------#
 
+DEFAULT_SHOW_DURATION = 120
+MAX_SHOW_DURATION = 24 * 60
+# the time a show occupies, as used by the booking constraints and their lookups
+BOOKED_RANGE = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+
+def version_column():
+    # Row version bumped by every UPDATE issued through the ORM or Core
+    # update(), including the show counter updates. Used to build ETags.
+    return db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                     onupdate=db.literal_column('version', db.Integer) + 1)
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        # the few venues still waiting to be purged, see deletion.py
+        db.Index('ix_venue_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -37,10 +57,17 @@ class Venue(db.Model):
     upcoming_shows_count = db.Column(db.Integer, default=0)
     past_shows_count = db.Column(db.Integer, default=0)
     shows = db.relationship('Show', backref='venue', lazy=True)
+    version = version_column()
+    # set when the venue is deleted; hidden from then on until it is purged
+    deleted_at = db.Column(db.DateTime)
 
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artist_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -58,13 +85,55 @@ class Artist(db.Model):
     upcoming_shows_count = db.Column(db.Integer, default=0)
     past_shows_count = db.Column(db.Integer, default=0)
     shows = db.relationship('Show', backref='artist', lazy=True)
+    version = version_column()
+    deleted_at = db.Column(db.DateTime)
 
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'shows'
-    id = db.Column(db.Integer, primary_key=True)
+    __table_args__ = (
+        # detail pages: one owner's shows in start_time order
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows keyset pagination and date ranges
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # rollover_shows() only looks at shows still flagged upcoming
+        db.Index('ix_shows_upcoming_start_time', 'start_time', postgresql_where=db.text('upcoming')),
+        # overlap lookups bound start_time by the longest possible show
+        db.CheckConstraint(f'duration >= 0 AND duration <= {MAX_SHOW_DURATION}', name='ck_shows_duration'),
+        # monthly partitions shows_pYYYY_MM plus shows_default, see partitions.py
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+    # a partitioned table's primary key has to include the partition key; rows
+    # are still identified by id alone
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     upcoming = db.Column(db.Boolean, nullable=False, default=True)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    # minutes the show occupies its venue and artist
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION,
+                         server_default=str(DEFAULT_SHOW_DURATION))
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
+    version = version_column()
+
+    __mapper_args__ = {'primary_key': [id]}
+
+
+def booking_constraints(table_name):
+    # Exclusion constraints that keep a venue's and an artist's shows in one
+    # partition from overlapping. Postgres does not support them on the
+    # partitioned parent, so every partition gets its own (needs btree_gist).
+    return [
+        f'ALTER TABLE {table_name} ADD CONSTRAINT {table_name}_{owner}_booking '
+        f'EXCLUDE USING gist ({owner}_id WITH =, {BOOKED_RANGE} WITH &&)'
+        for owner in ('venue', 'artist')
+    ]
+
+
+# db.create_all() (scratch databases) gets a catch-all partition, so inserts work
+# before any monthly partition exists
+db.event.listen(Show.__table__, 'after_create', db.DDL('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+db.event.listen(Show.__table__, 'after_create', db.DDL('CREATE TABLE shows_default PARTITION OF shows DEFAULT'))
+for statement in booking_constraints('shows_default'):
+    db.event.listen(Show.__table__, 'after_create', db.DDL(statement))
@@ -0,0 +1,268 @@
+import pickle
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import Response, g, make_response, request, session
+
+from replicas import replica_router
+
+
+# ----------------------------------------------------------------------------#
+# Rendered page cache.
+# ----------------------------------------------------------------------------#
+
+# Rendered GET pages are cached per endpoint, view arguments and query string.
+# Every entry records the version of each tag it depends on ("venues",
+# "venue:3", ...). Write handlers bump tag versions through invalidate(), and
+# an entry whose recorded versions no longer match is treated as a miss. Tag
+# versions live in the backend, so a shared backend invalidates every worker.
+#
+# An entry must never hold a page older than its recorded versions. Misses
+# therefore render from the primary, as a lagging replica could still return
+# rows from before a write whose bump is already visible. Static tags are read
+# before rendering. Tags added while rendering are only known afterwards, so
+# every invalidation also bumps ANY_TAG, and a render during which it moved is
+# not stored.
+
+ANY_TAG = '*'
+
+
+class LRUBackend:
+    # In-process store bounded by entry count and total body size.
+
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._tags = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def tag_versions(self, tags):
+        return {tag: self._tags.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry['body'])
+
+
+class SharedBackend:
+    # Store shared by all workers. `client` needs the redis-py style
+    # get(key), set(key, value, ex=seconds), mget(keys) and incr(key); a
+    # redis.Redis instance works as is, and InMemoryStore stands in locally.
+
+    def __init__(self, client, prefix='fyyur:page:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = pickle.loads(raw)
+        return entry if entry['expires'] > time.time() else None
+
+    def set(self, key, entry):
+        ttl = max(1, int(entry['expires'] - time.time()))
+        self.client.set(self.prefix + key, pickle.dumps(entry), ex=ttl)
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        values = self.client.mget([self.prefix + 'tag:' + tag for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def bump(self, tags):
+        for tag in tags:
+            self.client.incr(self.prefix + 'tag:' + tag)
+
+    def clear(self):
+        pass
+
+
+class InMemoryStore:
+    # Local stand-in for a redis client, for development and single-host use.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = {}
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0] or 0) + 1
+            self._data[key] = (value, None)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class PageCache:
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.enabled = True
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.invalidations = 0
+        self._own_bumps = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        if self.backend is None:
+            kind = app.config.get('PAGE_CACHE_BACKEND', 'lru')
+            if kind == 'shared':
+                self.backend = SharedBackend(app.config.get('PAGE_CACHE_CLIENT') or InMemoryStore())
+            else:
+                self.backend = LRUBackend(app.config.get('PAGE_CACHE_MAX_ENTRIES', 1000),
+                                          app.config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        app.extensions['page_cache'] = self
+
+    @staticmethod
+    def _key():
+        args = ','.join(f'{name}={value}' for name, value in sorted(request.view_args.items()))
+        query = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+        return f'{request.endpoint}:{args}?{query}'
+
+    def _usable(self):
+        # Pending flash messages are rendered into the page, so never cache them.
+        # A client pinned to the primary after a write must see it, even from a
+        # worker whose in-process backend never saw the tags it bumped.
+        return self.enabled and request.method == 'GET' and '_flashes' not in session \
+            and not replica_router.pinned()
+
+    def add_tags(self, *tags):
+        # called from inside a cached view for dependencies only known after loading
+        if 'page_cache_tags' in g:
+            g.page_cache_tags.update(tags)
+
+    def expire_at(self, timestamp):
+        # shorten the entry's lifetime, e.g. to when the next upcoming show starts
+        if 'page_cache_expires' in g:
+            g.page_cache_expires = min(g.page_cache_expires, timestamp)
+
+    def cached(self, *tags):
+        # tags may contain "{name}" placeholders filled from the view arguments
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self._usable():
+                    self.bypasses += 1
+                    return view(**kwargs)
+
+                key = self._key()
+                entry = self.backend.get(key)
+                if entry is not None and self.backend.tag_versions(entry['tags']) == entry['tags']:
+                    self.hits += 1
+                    response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses += 1
+                static_tags = {tag.format(**kwargs) for tag in tags}
+                versions = self.backend.tag_versions(static_tags | {ANY_TAG})
+                any_version = versions.pop(ANY_TAG)
+                g.page_cache_tags = set(static_tags)
+                g.page_cache_expires = time.time() + self.ttl
+                replica_router.use_primary()
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and not response.direct_passthrough and '_flashes' not in session:
+                    dynamic = self.backend.tag_versions((g.page_cache_tags - static_tags) | {ANY_TAG})
+                    # nothing was invalidated while rendering
+                    if dynamic.pop(ANY_TAG) == any_version:
+                        versions.update(dynamic)
+                        self.backend.set(key, {
+                            'body': response.get_data(),
+                            'mimetype': response.mimetype,
+                            'tags': versions,
+                            'expires': g.page_cache_expires
+                        })
+                response.headers['X-Cache'] = 'MISS'
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *tags):
+        self.invalidations += 1
+        # counted before the bump, so a reader never takes this process's bump for another's
+        with self._lock:
+            for tag in tags:
+                self._own_bumps[tag] = self._own_bumps.get(tag, 0) + 1
+        self.backend.bump((*tags, ANY_TAG))
+
+    def own_bumps(self, tags):
+        # how often this process has bumped each tag
+        with self._lock:
+            return {tag: self._own_bumps.get(tag, 0) for tag in tags}
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+page_cache = PageCache()
@@ -0,0 +1,140 @@
+import re
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import text
+
+from counters import apply_show_delta
+from loaders import current_time
+from models import db, Venue, Artist, booking_constraints
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Shows partitions.
+# ----------------------------------------------------------------------------#
+
+# shows is range-partitioned on start_time into monthly partitions named
+# shows_pYYYY_MM, plus shows_default for rows outside all of them. Queries
+# bounded on start_time (upcoming shows, /shows date ranges, rollover) only
+# read the partitions that can match. ensure_partitions() creates the coming
+# months ahead of time; archive_partitions() detaches old months, which takes
+# their shows off the site and out of the venue/artist counters. Detached
+# partitions are kept in the "archive" schema unless dropped.
+
+_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'shows_p{month:%Y_%m}'
+
+
+def monthly_partitions(connection):
+    # {name: (lower, upper)} of the monthly partitions attached to shows
+    rows = connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'shows'::regclass"
+    ))
+    partitions = {}
+    for name, bounds in rows:
+        match = _BOUNDS.search(bounds)
+        if match:
+            partitions[name] = tuple(datetime.fromisoformat(value) for value in match.groups())
+    return partitions
+
+
+def create_partition(connection, month):
+    # Built as a plain table and then attached, which locks shows less than
+    # CREATE TABLE ... PARTITION OF. Shows of that month that landed in
+    # shows_default move into the new partition.
+    name = partition_name(month)
+    lower, upper = month, add_months(month, 1)
+    connection.execute(text(f'CREATE TABLE {name} (LIKE shows INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    for statement in booking_constraints(name):
+        connection.execute(text(statement))
+    connection.execute(text(
+        f'WITH moved AS (DELETE FROM shows_default WHERE start_time >= :lower AND start_time < :upper RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), {"lower": lower, "upper": upper})
+    connection.execute(text(
+        f"ALTER TABLE shows ATTACH PARTITION {name} FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+    ))
+    return name
+
+
+def ensure_partitions(months_ahead=12, since=None, now=None):
+    # Monthly partitions from the current month through `months_ahead` months
+    # later, plus one for every month since `since` that has shows sitting in
+    # shows_default (every ATTACH has to scan that partition). One commit each.
+    current = month_start(now or current_time())
+    wanted = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    connection = db.session.connection()
+    stray = connection.execute(text(
+        "SELECT DISTINCT date_trunc('month', start_time) FROM shows_default WHERE start_time >= :since"
+    ), {"since": since or datetime.min}).scalars()
+    wanted.update(stray)
+
+    existing = monthly_partitions(connection)
+    created = []
+    for month in sorted(wanted):
+        if partition_name(month) in existing:
+            continue
+        created.append(create_partition(db.session.connection(), month))
+        db.session.commit()
+    db.session.commit()
+    return created
+
+
+def archive_partitions(before, drop=False):
+    # Detach every monthly partition that ends on or before `before` and take
+    # its shows out of the counters, one partition per transaction. Detaching
+    # cannot be CONCURRENTLY while shows_default exists, so each one holds an
+    # exclusive lock on shows for a moment.
+    if before > month_start(current_time()):
+        raise ValueError('only partitions that ended before the current month can be archived')
+
+    archived = []
+    touched = set()
+    partitions = monthly_partitions(db.session.connection())
+    for name, (lower, upper) in sorted(partitions.items(), key=lambda item: item[1]):
+        if upper > before:
+            continue
+        connection = db.session.connection()
+        connection.execute(text(f'ALTER TABLE shows DETACH PARTITION {name}'))
+        rows = connection.execute(text(
+            f'SELECT venue_id, artist_id, upcoming, count(*) AS shows FROM {name} GROUP BY venue_id, artist_id, upcoming'
+        )).all()
+        for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+            counts = {True: Counter(), False: Counter()}
+            for row in rows:
+                counts[row.upcoming][getattr(row, key)] -= row.shows
+            apply_show_delta(connection, model, upcoming=counts[True], past=counts[False])
+            touched.update(f"{key.split('_')[0]}:{getattr(row, key)}" for row in rows)
+
+        if drop:
+            connection.execute(text(f'DROP TABLE {name}'))
+        else:
+            # archived rows must not keep venues and artists from being deleted
+            foreign_keys = connection.execute(text(
+                f"SELECT conname FROM pg_constraint WHERE conrelid = '{name}'::regclass AND contype = 'f'"
+            )).scalars().all()
+            for constraint in foreign_keys:
+                connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {constraint}'))
+            connection.execute(text('CREATE SCHEMA IF NOT EXISTS archive'))
+            connection.execute(text(f'ALTER TABLE {name} SET SCHEMA archive'))
+        db.session.commit()
+        archived.append(name)
+
+    if archived:
+        page_cache.invalidate('shows', 'venues', 'artists', *touched)
+    return archived
@@ -0,0 +1,135 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+
+# ----------------------------------------------------------------------------#
+# On-demand request profiling.
+# ----------------------------------------------------------------------------#
+
+# A request is profiled when it is picked by PROFILE_SAMPLE_RATE or carries
+# PROFILE_HEADER set to PROFILE_TOKEN. Its profile is written to PROFILE_DIR
+# as either cProfile stats ('pstats', open with `python -m pstats` or
+# snakeviz) or sampled collapsed stacks ('collapsed', feed to flamegraph.pl or
+# speedscope). File names carry the endpoint and view arguments. With
+# PROFILE_ENABLED off no hooks are installed, so untriggered requests cost
+# nothing; with it on they cost one random() call and a header lookup.
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.=-]+')
+
+
+class StackSampler:
+    # Samples one thread's Python stack every `interval` seconds from a helper
+    # thread and counts identical stacks, in the "a;b;c <count>" collapsed format.
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as target:
+            for stack, count in self.stacks.most_common():
+                target.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+
+    def __init__(self):
+        self.directory = 'profiles'
+        self.sample_rate = 0.0
+        self.header = 'X-Fyyur-Profile'
+        self.token = None
+        self.format = 'pstats'
+        self.interval = 0.005
+
+    def init_app(self, app):
+        if not app.config.get('PROFILE_ENABLED', False):
+            return
+        self.directory = app.config.get('PROFILE_DIR', 'profiles')
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.header = app.config.get('PROFILE_HEADER', 'X-Fyyur-Profile')
+        self.token = app.config.get('PROFILE_TOKEN')
+        self.format = app.config.get('PROFILE_FORMAT', 'pstats')
+        self.interval = app.config.get('PROFILE_INTERVAL', 0.005)
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        app.extensions['profiler'] = self
+
+    def _triggered(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        supplied = request.headers.get(self.header)
+        return bool(self.token and supplied and hmac.compare_digest(supplied, self.token))
+
+    def _start(self):
+        if not self._triggered():
+            return
+        if self.format == 'collapsed':
+            profile = StackSampler(threading.get_ident(), self.interval)
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is already active in this process
+                return
+        g.request_profile = (profile, time.time())
+
+    def _finish(self, error=None):
+        entry = g.pop('request_profile', None)
+        if entry is None:
+            return
+        profile, started = entry
+        if isinstance(profile, StackSampler):
+            profile.stop()
+        else:
+            profile.disable()
+        path = os.path.join(self.directory, self._file_name(started))
+        if isinstance(profile, StackSampler):
+            profile.dump(path)
+        else:
+            profile.dump_stats(path)
+
+    def _file_name(self, started):
+        # e.g. 20240101-120000.123-4711-show_venue-venue_id=3.prof
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(started)) \
+            + f'.{int(started * 1000) % 1000:03d}-{os.getpid()}'
+        args = '-'.join(f'{name}={value}' for name, value in sorted((request.view_args or {}).items()))
+        parts = [stamp, request.endpoint or 'unknown'] + ([args] if args else [])
+        extension = 'collapsed' if self.format == 'collapsed' else 'prof'
+        return _UNSAFE.sub('_', '-'.join(parts))[:200] + '.' + extension
+
+
+request_profiler = RequestProfiler()
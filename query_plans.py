@@ -0,0 +1,114 @@
+import json
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import quote
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from loaders import _make_cursor
+from models import db, Venue, Artist, Show
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Query plan checks.
+# ----------------------------------------------------------------------------#
+
+# The hot read routes are requested through the test client against the
+# configured (seeded) database, every SELECT they send that touches shows is
+# captured with its parameters, and each one is run again under EXPLAIN. A
+# sequential scan on shows (or one of its partitions) fails the check. By
+# default enable_seqscan is switched off first, so on a small database the
+# check still tells whether an index *can* serve the query.
+
+HOT_PATHS = (
+    '/venues/{venue}',
+    '/artists/{artist}',
+    '/shows',
+    '/shows?upcoming=1',
+    '/shows?after={cursor}',
+    '/shows?start={day}&end={next_day}',
+    '/api/v1/venues/{venue}',
+    '/api/v1/artists/{artist}',
+    '/api/v1/shows',
+    '/api/v1/shows/{show}',
+)
+
+
+def sample_values():
+    # the busiest venue and artist and a show from the middle of the table
+    venue = Venue.query.order_by((Venue.upcoming_shows_count + Venue.past_shows_count).desc()).first()
+    artist = Artist.query.order_by((Artist.upcoming_shows_count + Artist.past_shows_count).desc()).first()
+    total = Show.query.count()
+    show = Show.query.order_by(Show.start_time, Show.id).offset(total // 2).first()
+    if venue is None or artist is None or show is None:
+        return None
+    return {
+        "venue": venue.id,
+        "artist": artist.id,
+        "show": show.id,
+        "cursor": quote(_make_cursor(show.start_time, show.id)),
+        "day": show.start_time.date().isoformat(),
+        "next_day": (show.start_time + timedelta(days=1)).date().isoformat()
+    }
+
+
+@contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT') and 'shows' in statement:
+            statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+
+
+def seq_scans(plan, table='shows'):
+    # relation names of the sequential scans on `table` or its partitions
+    found = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        relation = node.get('Relation Name') or ''
+        if node.get('Node Type') == 'Seq Scan' and (relation == table or relation.startswith(table + '_')):
+            found.append(relation)
+        nodes.extend(node.get('Plans', []))
+    return found
+
+
+def explain(statement, parameters, allow_seqscan=False):
+    with db.engine.connect() as connection:
+        if not allow_seqscan:
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        connection.rollback()
+    plan = rows if isinstance(rows, list) else json.loads(rows)
+    return plan[0]['Plan']
+
+
+def check_plans(values, allow_seqscan=False):
+    # [(path, statement, plan, seq scans)] for every shows query of the hot paths
+    results = []
+    client = current_app.test_client()
+    cache_enabled = page_cache.enabled
+    page_cache.enabled = False
+    try:
+        for path in HOT_PATHS:
+            path = path.format(**values)
+            with captured_statements() as statements:
+                response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}')
+            for statement, parameters in statements:
+                plan = explain(statement, parameters, allow_seqscan)
+                results.append((path, statement, plan, seq_scans(plan)))
+    finally:
+        page_cache.enabled = cache_enabled
+    return results
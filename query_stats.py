@@ -0,0 +1,136 @@
+import hashlib
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ----------------------------------------------------------------------------#
+# Per-request SQL statistics.
+# ----------------------------------------------------------------------------#
+
+# Every statement run while handling a request is counted, timed and reduced
+# to a fingerprint (its text with parameters and literals replaced), so the
+# same query issued once per row shows up as one fingerprint repeated many
+# times. Totals go out in a Server-Timing header. Routes that go over their
+# query budget or repeat a statement shape too often are logged, or raise
+# QueryBudgetExceeded when QUERY_STATS_STRICT is set (for tests).
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|(?<![:\w]):[a-zA-Z_]\w*|\$\d+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement):
+    # "... WHERE id IN (%(id_1_1)s, %(id_1_2)s) AND name = 'x'" -> "... WHERE id IN (?+) AND name = ?"
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _LITERAL.sub('?', shape)
+    shape = _LIST.sub('(?+)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def short_hash(shape):
+    return hashlib.sha1(shape.encode()).hexdigest()[:8]
+
+
+class RequestQueries:
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.started = time.perf_counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[fingerprint(statement)] += 1
+
+    def repeated(self, limit):
+        # statement shapes issued more than `limit` times, most frequent first
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > limit]
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.enabled = True
+        self.strict = False
+        self.budget = 10
+        self.budgets = {}
+        self.repeat_limit = 3
+        self._listening = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_STATS_ENABLED', True)
+        self.strict = app.config.get('QUERY_STATS_STRICT', False)
+        self.budget = app.config.get('QUERY_BUDGET', 10)
+        self.budgets = app.config.get('QUERY_BUDGETS', {})
+        self.repeat_limit = app.config.get('QUERY_REPEAT_LIMIT', 3)
+        if not self._listening:
+            # listening on the Engine class covers every engine the app creates
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.extensions['query_stats'] = self
+
+    @staticmethod
+    def current():
+        # the RequestQueries of the request being handled, or None
+        return g.get('sql_queries') if has_app_context() else None
+
+    def _start(self):
+        if self.enabled:
+            g.sql_queries = RequestQueries()
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        queries = self.current()
+        if queries is not None:
+            queries.record(statement, time.perf_counter() - context.query_started)
+
+    def _finish(self, response):
+        queries = self.current()
+        if queries is None:
+            return response
+        total = (time.perf_counter() - queries.started) * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={queries.seconds * 1000:.2f};desc="{queries.count} queries", app;dur={total:.2f}'
+        )
+        # a streamed body runs its queries after this point, so it is not checked
+        if not response.is_streamed:
+            self.check(request.endpoint, queries)
+        return response
+
+    def check(self, endpoint, queries):
+        budget = self.budgets.get(endpoint, self.budget)
+        problems = []
+        if queries.count > budget:
+            problems.append(f'{queries.count} queries, budget is {budget}')
+        for shape, count in queries.repeated(self.repeat_limit):
+            problems.append(f'statement {short_hash(shape)} ran {count} times: {shape[:200]}')
+        if not problems:
+            return
+        message = f'{endpoint}: ' + '; '.join(problems)
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+
+
+query_stats = QueryStats()
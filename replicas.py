@@ -0,0 +1,109 @@
+import time
+from functools import wraps
+from itertools import cycle
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+# ----------------------------------------------------------------------------#
+# Read replica routing.
+# ----------------------------------------------------------------------------#
+
+# Replicas are ordinary Flask-SQLAlchemy binds whose keys start with
+# "replica" (config.SQLALCHEMY_BINDS, built from DATABASE_REPLICA_URLS). Views
+# marked with @replica_router.read_only read from one replica, picked per
+# request round-robin or by fewest checked-out connections (the JSON API
+# blueprint calls use_replica() for all of its routes). Everything else,
+# every flush and every INSERT/UPDATE/DELETE goes to the primary. A request
+# that writes pins its client to the primary for REPLICA_PIN_SECONDS through
+# the session cookie, so the page it redirects to sees its own write.
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            replica = replica_router.engine_for(self, clause)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    replica_router.wrote()
+
+
+class ReplicaRouter:
+
+    def __init__(self):
+        self.db = None
+        self.keys = []
+        self.strategy = 'round_robin'
+        self.pin_seconds = 5
+        self._next_key = None
+
+    def init_app(self, app, db):
+        self.db = db
+        self.keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                           if key and key.startswith('replica'))
+        self.strategy = app.config.get('REPLICA_STRATEGY', 'round_robin')
+        self.pin_seconds = app.config.get('REPLICA_PIN_SECONDS', 5)
+        self._next_key = cycle(self.keys)
+        app.after_request(self._pin_writer)
+        app.extensions['replica_router'] = self
+
+    def use_replica(self):
+        # let the current request read from a replica, unless its client just wrote
+        # or the request must read the primary
+        if self.keys and not self.pinned() and not g.get('db_primary_only'):
+            g.db_read_replica = True
+
+    def use_primary(self):
+        # keep the current request on the primary, even in read_only views
+        g.db_primary_only = True
+
+    def pinned(self):
+        # whether this client wrote within the last REPLICA_PIN_SECONDS
+        return session.get('db_primary_until', 0) >= time.time()
+
+    def read_only(self, view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            self.use_replica()
+            return view(**kwargs)
+
+        return wrapper
+
+    def wrote(self):
+        if has_request_context():
+            g.db_wrote = True
+
+    def engine_for(self, db_session, clause):
+        # the replica engine for this statement, or None for the primary
+        if not self.keys or not has_request_context():
+            return None
+        # Core INSERT/UPDATE/DELETE statements skip the flush, so they pin here
+        if db_session._flushing or getattr(clause, 'is_dml', False):
+            self.wrote()
+            return None
+        if not g.get('db_read_replica') or g.get('db_wrote'):
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self._choose()
+        return self.db.engines[g.db_replica]
+
+    def _choose(self):
+        if self.strategy == 'least_connections':
+            return min(self.keys, key=lambda key: getattr(self.db.engines[key].pool, 'checkedout', int)())
+        return next(self._next_key)
+
+    def _pin_writer(self, response):
+        if g.get('db_wrote'):
+            session['db_primary_until'] = time.time() + self.pin_seconds
+        return response
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,42 @@
+from flask import current_app
+from sqlalchemy import func, or_
+
+from loaders import live
+from models import db
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+# Venue and artist search runs against fyyur_search_text(name, city, genres),
+# which is covered by a pg_trgm GIN index (migration 3f9d2c1a7b64). Substring
+# matches keep the old partial, case-insensitive behaviour; trigram word
+# similarity adds typo tolerance, and results are ranked by similarity.
+
+DEFAULT_RESULT_LIMIT = 50
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_text(model):
+    return func.fyyur_search_text(model.name, model.city, model.genres)
+
+
+def search(model, term, limit=None):
+    if limit is None:
+        limit = current_app.config.get('SEARCH_RESULT_LIMIT', DEFAULT_RESULT_LIMIT)
+    term = term.strip().lower()
+    document = search_text(model)
+
+    query = db.session.query(model.id, model.name, model.upcoming_shows_count).filter(live(model))
+    if not term:
+        return query.order_by(model.name).limit(limit).all()
+
+    rank = func.word_similarity(term, document)
+    return query.filter(or_(
+        document.ilike('%' + _escape_like(term) + '%', escape='\\'),
+        document.op('%>')(term)
+    )).order_by(rank.desc(), model.name).limit(limit).all()
@@ -2,3 +2,33 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for the navbar search boxes, fed by /api/search/suggest.
+document.querySelectorAll('input[data-suggest]').forEach(function (input) {
+  var kind = input.dataset.suggest;
+  var list = document.getElementById(input.getAttribute('list'));
+  var pending = null;
+
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    if (pending) {
+      clearTimeout(pending);
+    }
+    if (!q) {
+      list.innerHTML = '';
+      return;
+    }
+    pending = setTimeout(function () {
+      fetch('/api/search/suggest?q=' + encodeURIComponent(q))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          list.innerHTML = '';
+          data[kind].forEach(function (item) {
+            var option = document.createElement('option');
+            option.value = item.name;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
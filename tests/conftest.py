@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+
+# Tests that need Postgres run against the database in DATABASE_URL (a seeded
+# scratch database, see benchmarks/generate.py) and are skipped without it.
+
+@pytest.fixture(scope='session')
+def app():
+    if not os.environ.get('DATABASE_URL'):
+        pytest.skip('set DATABASE_URL to a seeded scratch database')
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        yield app
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from bookings import BookingIndex, IntervalTree, find_conflicts
+from models import db, Show
+
+EIGHT_PM = datetime(2035, 4, 1, 20, 0)
+
+
+def hours(count):
+    return EIGHT_PM + timedelta(hours=count)
+
+
+def test_interval_tree_finds_overlaps():
+    tree = IntervalTree()
+    tree.add(hours(0), hours(2), 'a')
+    tree.add(hours(1), hours(3), 'b')
+    tree.add(hours(5), hours(6), 'c')
+    assert len(tree) == 3
+    assert sorted(tree.overlapping(hours(1.5), hours(1.75))) == ['a', 'b']
+    assert sorted(tree.overlapping(hours(2.5), hours(5.5))) == ['b', 'c']
+    assert tree.overlapping(hours(3), hours(5)) == []
+
+
+def test_interval_tree_touching_intervals_do_not_overlap():
+    tree = IntervalTree()
+    tree.add(hours(0), hours(2), 'a')
+    assert tree.overlapping(hours(2), hours(4)) == []
+    assert tree.overlapping(hours(-2), hours(0)) == []
+    assert tree.overlapping(hours(-2), hours(0.01)) == ['a']
+
+
+def test_interval_tree_ignores_empty_intervals():
+    tree = IntervalTree()
+    tree.add(hours(1), hours(1), 'empty')
+    assert len(tree) == 0
+    tree.add(hours(0), hours(2), 'a')
+    assert tree.overlapping(hours(1), hours(1)) == []
+
+
+def test_interval_tree_matches_brute_force():
+    tree = IntervalTree()
+    intervals = [(hours(start % 37), hours(start % 37 + start % 5 + 1), start) for start in range(0, 400, 7)]
+    for start, end, value in intervals:
+        tree.add(start, end, value)
+    for lower in range(0, 40, 3):
+        query = (hours(lower), hours(lower + 2))
+        expected = sorted(value for start, end, value in intervals if start < query[1] and end > query[0])
+        assert sorted(tree.overlapping(*query)) == expected
+
+
+def test_booking_index_checks_venue_and_artist_separately():
+    bookings = BookingIndex()
+    assert bookings.book(1, 10, EIGHT_PM, 120) == {}
+    errors = bookings.book(1, 11, hours(1), 60)
+    assert list(errors) == ['venue_id']
+    errors = bookings.book(2, 10, hours(1), 60)
+    assert list(errors) == ['artist_id']
+    assert bookings.book(1, 10, hours(2), 60) == {}
+
+
+def test_find_conflicts_matches_stored_shows(app):
+    show = db.session.execute(db.select(Show).limit(1)).scalar_one_or_none()
+    if show is None:
+        pytest.skip('the database has no shows to check with')
+    venue_id, artist_id, start, duration = show.venue_id, show.artist_id, show.start_time, show.duration
+    try:
+        if duration:
+            errors = find_conflicts(venue_id, artist_id, start, duration)
+            assert any(f'(show {show.id})' in message for message in errors['venue_id'])
+            assert any(f'(show {show.id})' in message for message in errors['artist_id'])
+        # a booking that starts when this show ends does not collide with it
+        errors = find_conflicts(venue_id, artist_id, start + timedelta(minutes=duration), 30)
+        assert not any(f'(show {show.id})' in message for messages in errors.values() for message in messages)
+    finally:
+        db.session.rollback()
@@ -0,0 +1,58 @@
+import pytest
+from flask import Flask
+
+from directory import Freshness, PrefixIndex, suggest_index
+from models import db, Venue
+from page_cache import InMemoryStore, SharedBackend, page_cache
+
+
+@pytest.fixture
+def shared_tags():
+    # tag versions as every worker sees them with the shared backend
+    backend = page_cache.backend
+    page_cache.backend = SharedBackend(InMemoryStore())
+    try:
+        with Flask(__name__).app_context():
+            yield page_cache.backend
+    finally:
+        page_cache.backend = backend
+
+
+def test_own_writes_keep_the_index(shared_tags):
+    freshness = Freshness('venues', 'artists')
+    freshness.loading()
+    page_cache.invalidate('venues', 'venue:3')
+    page_cache.invalidate('venues', 'artists', 'shows')
+    assert not freshness.stale()
+
+
+def test_writes_elsewhere_reload_the_index(shared_tags):
+    freshness = Freshness('venues', 'artists')
+    freshness.loading()
+    page_cache.invalidate('venues')
+    # another worker's bump goes straight to the backend
+    shared_tags.bump(['artists'])
+    assert freshness.stale()
+    freshness.loading()
+    assert not freshness.stale()
+
+
+def test_suggestions_pick_up_a_new_venue_without_reloading(app, monkeypatch):
+    client = app.test_client()
+    client.get('/api/search/suggest?q=a')
+    loads = []
+    load = PrefixIndex._load
+    monkeypatch.setattr(PrefixIndex, '_load', lambda self: loads.append(1) or load(self))
+    form = dict(name='Zyxwv Hall', city='Austin', state='TX', address='1 Main St', phone='123-123-1234',
+                genres='Jazz', facebook_link='https://facebook.com/zyxwv', image_link='https://example.com/z.png',
+                website_link='https://example.com', seeking_description='')
+    client.post('/venues/create', data=form)
+    try:
+        found = client.get('/api/search/suggest?q=zyxwv').json['venues']
+        assert [venue['name'] for venue in found] == ['Zyxwv Hall']
+        assert loads == []
+    finally:
+        db.session.execute(db.delete(Venue).where(Venue.name == 'Zyxwv Hall'))
+        db.session.commit()
+        suggest_index.clear()
+        page_cache.invalidate('venues')
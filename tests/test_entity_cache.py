@@ -0,0 +1,41 @@
+import time
+
+import pytest
+from markupsafe import escape
+from sqlalchemy import update
+
+from entity_cache import entity_cache
+from models import db, Venue
+
+
+@pytest.fixture
+def renamed_elsewhere(app):
+    # a venue whose snapshot this worker holds while another worker renames it
+    venue_id = db.session.execute(db.select(Venue.id).where(Venue.deleted_at.is_(None)).limit(1)).scalar()
+    if venue_id is None:
+        pytest.skip('the database has no venues to check with')
+    name = entity_cache.get(Venue, venue_id).name
+    table = Venue.__table__
+    db.session.execute(update(table).where(table.c.id == venue_id).values(name=name + ' (renamed)'))
+    db.session.commit()
+    try:
+        yield venue_id, name + ' (renamed)'
+    finally:
+        db.session.execute(update(table).where(table.c.id == venue_id).values(name=name))
+        db.session.commit()
+        entity_cache.clear()
+
+
+def test_api_body_matches_its_etag(app, renamed_elsewhere):
+    venue_id, name = renamed_elsewhere
+    response = app.test_client().get(f'/api/v1/venues/{venue_id}')
+    assert response.json['name'] == name
+
+
+def test_pinned_client_skips_the_cache(app, renamed_elsewhere):
+    venue_id, name = renamed_elsewhere
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['db_primary_until'] = time.time() + 60
+    for path in (f'/venues/{venue_id}', f'/venues/{venue_id}/edit'):
+        assert escape(name) in client.get(path).get_data(as_text=True)
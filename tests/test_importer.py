@@ -0,0 +1,64 @@
+import pytest
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from forms import ArtistForm, ShowForm, VenueForm
+from importer import RowRules
+
+# The importer checks rows with RowRules instead of instantiating the WTForms
+# forms; these rows must be accepted or rejected on the same fields as the
+# web forms do.
+
+VENUE = {
+    "name": "The Musical Hop", "city": "San Francisco", "state": "CA", "address": "1015 Folsom Street",
+    "phone": "123-123-1234", "image_link": "https://example.com/hop.png", "genres": ["Jazz", "Reggae"],
+    "facebook_link": "https://www.facebook.com/TheMusicalHop", "website_link": "https://www.themusicalhop.com",
+    "seeking_description": "Looking for local artists"
+}
+ARTIST = {key: value for key, value in VENUE.items() if key != 'address'}
+SHOW = {"venue_id": "1", "artist_id": "4", "start_time": "2035-04-01 20:00:00", "duration": "90"}
+
+CASES = [
+    (VenueForm, VENUE),
+    (VenueForm, dict(VENUE, name='')),
+    (VenueForm, dict(VENUE, state='XX')),
+    (VenueForm, dict(VENUE, genres=['Jazz', 'Polka'])),
+    (VenueForm, dict(VENUE, phone='')),
+    (ArtistForm, ARTIST),
+    (ArtistForm, dict(ARTIST, city='', genres=[])),
+    (ShowForm, SHOW),
+    (ShowForm, dict(SHOW, duration='')),
+    (ShowForm, dict(SHOW, duration='0')),
+    (ShowForm, dict(SHOW, duration='99999')),
+    (ShowForm, dict(SHOW, duration='ninety')),
+    (ShowForm, dict(SHOW, start_time='tomorrow')),
+    (ShowForm, dict(SHOW, venue_id='')),
+]
+
+
+@pytest.fixture(scope='module')
+def form_app():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', WTF_CSRF_ENABLED=False)
+    return app
+
+
+def _form_errors(form_app, form_class, row):
+    data = MultiDict([(name, item) for name, value in row.items()
+                      for item in (value if isinstance(value, list) else [value])])
+    with form_app.test_request_context(method='POST', data=data):
+        form = form_class()
+        form.validate()
+        return set(form.errors)
+
+
+@pytest.mark.parametrize('form_class, row', CASES)
+def test_row_rules_match_the_form(form_app, form_class, row):
+    values, errors = RowRules(form_class).clean(row)
+    assert set(errors) == _form_errors(form_app, form_class, row)
+
+
+def test_row_rules_accept_comma_separated_genres():
+    values, errors = RowRules(VenueForm).clean(dict(VENUE, genres='Jazz, Reggae'))
+    assert errors == {}
+    assert values['genres'] == ['Jazz', 'Reggae']
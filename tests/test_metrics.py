@@ -0,0 +1,62 @@
+import multiprocessing
+
+from flask import Flask
+
+from metrics import Metrics
+
+
+def _metrics(directory, run='1'):
+    metrics = Metrics()
+    metrics.directory = str(directory)
+    metrics.run = run
+    return metrics
+
+
+def _count_requests(directory, count, run='1'):
+    metrics = _metrics(directory, run)
+    for i in range(count):
+        metrics.inc('fyyur_http_requests_total', endpoint='index', method='GET', status='200')
+    metrics.flush()
+
+
+def _in_worker(target, *args):
+    worker = multiprocessing.get_context('fork').Process(target=target, args=args)
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+
+def _requests(metrics):
+    return metrics.collect().get(('fyyur_http_requests_total', '', (
+        ('endpoint', 'index'), ('method', 'GET'), ('status', '200'))), 0)
+
+
+def test_a_restart_drops_the_previous_runs_values(tmp_path):
+    _in_worker(_count_requests, tmp_path, 3, 'earlier')
+    _in_worker(_count_requests, tmp_path, 3, 'previous')
+    metrics = _metrics(tmp_path)
+    _in_worker(_count_requests, tmp_path, 3)
+    assert _requests(metrics) == 3
+
+
+def test_a_replaced_worker_keeps_its_counts(tmp_path):
+    running = _metrics(tmp_path)
+    running.inc('fyyur_http_requests_total', endpoint='index', method='GET', status='200')
+    running.flush()
+    _in_worker(_count_requests, tmp_path, 3)
+    _in_worker(_count_requests, tmp_path, 2)
+    # the second worker folded the first one's file into the archive
+    assert (tmp_path / 'metrics_archive.db').exists()
+    assert _requests(running) == 6
+
+
+def test_processes_outside_the_server_record_nothing(tmp_path):
+    _in_worker(_count_requests, tmp_path, 3)
+    app = Flask(__name__)
+    app.config.update(METRICS_DIR=str(tmp_path), METRICS_RUN=None)
+    command = Metrics()
+    command.init_app(app)
+    command.inc('fyyur_http_requests_total', endpoint='index', method='GET', status='200')
+    command.flush()
+    assert 'metrics' not in app.extensions
+    assert _requests(_metrics(tmp_path)) == 3
@@ -0,0 +1,35 @@
+from flask import Flask, g
+
+from page_cache import LRUBackend, PageCache
+
+
+def _app(cache, view):
+    app = Flask(__name__)
+    app.add_url_rule('/venues', 'venues', cache.cached('venues')(view))
+    return app
+
+
+def test_misses_render_from_the_primary():
+    cache = PageCache(LRUBackend())
+    app = _app(cache, lambda: 'primary' if g.get('db_primary_only') else 'replica')
+    client = app.test_client()
+    assert client.get('/venues').get_data(as_text=True) == 'primary'
+    assert client.get('/venues').headers['X-Cache'] == 'HIT'
+
+
+def test_a_render_overtaken_by_a_write_is_not_stored():
+    cache = PageCache(LRUBackend())
+    renders = []
+
+    def venues():
+        cache.add_tags('venue:3')
+        if not renders:
+            # another request writes while this one renders
+            cache.invalidate('venue:3')
+        renders.append(1)
+        return f'render {len(renders)}'
+
+    client = _app(cache, venues).test_client()
+    assert client.get('/venues').get_data(as_text=True) == 'render 1'
+    assert client.get('/venues').get_data(as_text=True) == 'render 2'
+    assert client.get('/venues').get_data(as_text=True) == 'render 2'
@@ -0,0 +1,12 @@
+import pytest
+
+from query_plans import check_plans, sample_values
+
+
+def test_hot_paths_do_not_scan_shows(app):
+    values = sample_values()
+    if values is None:
+        pytest.skip('the database has no venues, artists or shows to check with')
+    regressions = [(path, ' '.join(statement.split())[:200], scans)
+                   for path, statement, plan, scans in check_plans(values) if scans]
+    assert regressions == []
@@ -0,0 +1,75 @@
+import pytest
+from flask import Flask
+
+from page_cache import page_cache
+from query_plans import HOT_PATHS, sample_values
+from query_stats import QueryBudgetExceeded, QueryStats, RequestQueries, fingerprint, query_stats
+
+
+@pytest.mark.parametrize('statement, shape', [
+    ("SELECT * FROM venue WHERE id = %(id_1)s", "SELECT * FROM venue WHERE id = ?"),
+    ("SELECT * FROM venue WHERE id = 42 AND name = 'Hop''s'", "SELECT * FROM venue WHERE id = ? AND name = ?"),
+    ("SELECT * FROM venue WHERE id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)", "SELECT * FROM venue WHERE id IN (?+)"),
+    ("SELECT * FROM venue WHERE id IN ($1::INTEGER, $2::INTEGER)", "SELECT * FROM venue WHERE id IN (?+)"),
+    ("SELECT *\n  FROM   venue\n WHERE id = :id", "SELECT * FROM venue WHERE id = ?"),
+    ("SELECT now()::date", "SELECT now()::date"),
+])
+def test_fingerprint_normalizes_parameters_and_literals(statement, shape):
+    assert fingerprint(statement) == shape
+
+
+def test_fingerprint_groups_a_query_repeated_per_row():
+    queries = RequestQueries()
+    for venue_id in range(5):
+        queries.record(f'SELECT * FROM artist WHERE id = {venue_id}', 0.001)
+    queries.record('SELECT * FROM venue', 0.001)
+    assert queries.count == 6
+    assert queries.repeated(3) == [('SELECT * FROM artist WHERE id = ?', 5)]
+
+
+def _stats(strict):
+    stats = QueryStats()
+    stats.strict = strict
+    stats.budget = 3
+    stats.budgets = {'show_venue': 10}
+    return stats
+
+
+def _queries(*statements):
+    queries = RequestQueries()
+    for statement in statements:
+        queries.record(statement, 0.001)
+    return queries
+
+
+def test_strict_mode_raises_over_budget():
+    with pytest.raises(QueryBudgetExceeded, match='4 queries, budget is 3'):
+        _stats(strict=True).check('artists', _queries('SELECT 1', 'SELECT a', 'SELECT b', 'SELECT c'))
+
+
+def test_strict_mode_raises_on_repeated_statements():
+    with pytest.raises(QueryBudgetExceeded, match='ran 4 times'):
+        _stats(strict=True).check('show_venue', _queries(*[f'SELECT * FROM shows WHERE id = {i}' for i in range(4)]))
+
+
+def test_per_endpoint_budget_and_lenient_mode():
+    stats = _stats(strict=True)
+    stats.check('show_venue', _queries('SELECT 1', 'SELECT a', 'SELECT b', 'SELECT c'))
+    app = Flask(__name__)
+    with app.app_context():
+        _stats(strict=False).check('artists', _queries('SELECT 1', 'SELECT a', 'SELECT b', 'SELECT c'))
+
+
+def test_hot_paths_stay_within_their_query_budgets(app):
+    values = sample_values()
+    if values is None:
+        pytest.skip('the database has no venues, artists or shows to check with')
+    client = app.test_client()
+    strict, cache_enabled = query_stats.strict, page_cache.enabled
+    # cached pages run no queries, so render every page
+    query_stats.strict, page_cache.enabled = True, False
+    try:
+        for path in HOT_PATHS:
+            assert client.get(path.format(**values)).status_code == 200, path
+    finally:
+        query_stats.strict, page_cache.enabled = strict, cache_enabled
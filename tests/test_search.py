@@ -0,0 +1,53 @@
+import re
+
+import pytest
+from sqlalchemy import text
+
+from models import db, Venue, Artist
+from search import search
+
+# Made-up names, so the rows below are the only ones a search for them finds.
+NAMES = ('Zephyrine Ballroom', 'Zephyrine Annex Hall')
+
+
+@pytest.fixture
+def listed(app):
+    # the same two names and city as a venue pair and an artist pair
+    if db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is None:
+        pytest.skip('search needs the pg_trgm extension (migration 3f9d2c1a7b64)')
+    rows = [Venue(name=NAMES[0], city='Quillmont', state='CA', address='1 Main St', genres=['Jazz']),
+            Venue(name=NAMES[1], city='Quillmont', state='CA', address='2 Main St', genres=['Folk']),
+            Artist(name=NAMES[0], city='Quillmont', state='CA', genres=['Jazz']),
+            Artist(name=NAMES[1], city='Quillmont', state='CA', genres=['Folk'])]
+    db.session.add_all(rows)
+    db.session.commit()
+    try:
+        yield
+    finally:
+        for model in (Venue, Artist):
+            db.session.execute(db.delete(model).where(model.name.in_(NAMES)))
+        db.session.commit()
+
+
+def _names(model, term):
+    return [row.name for row in search(model, term) if row.name in NAMES]
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+@pytest.mark.parametrize('term', ['zephyrine balroom', 'quilmont', 'ballroom zephyrine'])
+def test_typos_and_word_order_still_match(listed, model, term):
+    assert NAMES[0] in _names(model, term)
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+def test_results_are_ranked_by_similarity(listed, model):
+    # both match; the better match comes first although it sorts after by name,
+    # and equal matches fall back to the name
+    assert _names(model, 'quillmont jazz') == [NAMES[0], NAMES[1]]
+    assert _names(model, 'zephyrine') == [NAMES[1], NAMES[0]]
+
+
+@pytest.mark.parametrize('path', ['/venues/search', '/artists/search'])
+def test_search_pages_list_results_in_rank_order(app, listed, path):
+    page = app.test_client().post(path, data={'search_term': 'Quillmont Jazz'}).get_data(as_text=True)
+    assert [name for name in re.findall(r'<h5>(.*?)</h5>', page) if name in NAMES] == [NAMES[0], NAMES[1]]
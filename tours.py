@@ -0,0 +1,107 @@
+from collections import Counter
+
+from sqlalchemy import insert
+
+from bookings import BookingIndex, known_owners, lock_bookings
+from counters import apply_show_delta
+from forms import ShowForm
+from importer import RowRules
+from loaders import current_time
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Tours.
+# ----------------------------------------------------------------------------#
+
+# A tour is one artist's shows at any number of venues, created in one request
+# (the /tours/create form and POST /api/v1/tours). Each row is checked with
+# ShowForm's rules, all referenced ids are looked up in one query, bookings
+# are checked in memory (bookings.BookingIndex), and the accepted rows go in
+# with one multi-row INSERT and one counter update per table, all in a single
+# transaction. Rejected rows are reported with their errors; the rest of the
+# tour is still created.
+
+_show_rules = RowRules(ShowForm)
+
+TOUR_COLUMNS = ('venue_id', 'start_time', 'duration')
+
+
+def parse_tour_lines(text):
+    # the tour form's "venue_id, start_time[, duration]" lines as rows
+    rows = []
+    for line in text.splitlines():
+        if line.strip():
+            rows.append(dict(zip(TOUR_COLUMNS, (part.strip() for part in line.split(',')))))
+    return rows
+
+
+def create_tour(artist_id, rows):
+    # One result per row, in order: {"row", "status": "created", "show_id", ...}
+    # or {"row", "status": "rejected", "errors", ...}.
+    results = []
+    candidates = []
+    for number, row in enumerate(rows, start=1):
+        values, errors = _show_rules.clean({**row, "artist_id": artist_id})
+        for name in ('venue_id', 'artist_id'):
+            if name not in errors and not str(values[name]).strip().isdigit():
+                errors[name] = ['Not a valid id.']
+        result = {"row": number, "venue_id": row.get('venue_id'), "start_time": row.get('start_time')}
+        results.append(result)
+        if errors:
+            result.update(status='rejected', errors=errors)
+            continue
+        candidates.append((result, {
+            "venue_id": int(values['venue_id']),
+            "artist_id": int(values['artist_id']),
+            "start_time": values['start_time'],
+            "duration": values['duration'] or DEFAULT_SHOW_DURATION
+        }))
+    if not candidates:
+        return results
+
+    # normalized once, so "03" books, counts and invalidates artist 3
+    artist_id = candidates[0][1]['artist_id']
+    venue_ids, artist_ids = known_owners({show['venue_id'] for result, show in candidates}, [artist_id])
+    artist_known = bool(artist_ids)
+    accepted = []
+    connection = db.session.connection()
+    lock_bookings(connection, venue_ids, artist_ids)
+    bookings = BookingIndex()
+    bookings.load(connection, [show for result, show in candidates if show['venue_id'] in venue_ids])
+    now = current_time()
+    for result, show in candidates:
+        if not artist_known:
+            errors = {"artist_id": ['Unknown artist.']}
+        elif show['venue_id'] not in venue_ids:
+            errors = {"venue_id": ['Unknown venue.']}
+        else:
+            errors = bookings.book(show['venue_id'], show['artist_id'], show['start_time'], show['duration'])
+        if errors:
+            result.update(status='rejected', errors=errors)
+        else:
+            accepted.append((result, dict(show, upcoming=show['start_time'] > now)))
+    if not accepted:
+        db.session.rollback()
+        return results
+
+    table = Show.__table__
+    # one INSERT ... VALUES (...), (...) RETURNING id; ids come back in row order
+    show_ids = db.session.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True),
+        [show for result, show in accepted]
+    ).scalars().all()
+    # counters are normally kept by ORM events; the tour updates them once
+    venues = {True: Counter(), False: Counter()}
+    for result, show in accepted:
+        venues[show['upcoming']][show['venue_id']] += 1
+    apply_show_delta(connection, Venue, upcoming=venues[True], past=venues[False])
+    apply_show_delta(connection, Artist, upcoming={artist_id: sum(venues[True].values())},
+                     past={artist_id: sum(venues[False].values())})
+    db.session.commit()
+
+    for (result, show), show_id in zip(accepted, show_ids):
+        result.update(status='created', show_id=show_id, start_time=str(show['start_time']))
+    page_cache.invalidate('shows', f'artist:{artist_id}', *{f"venue:{show['venue_id']}" for result, show in accepted})
+    return results